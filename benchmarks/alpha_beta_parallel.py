@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import random
+import multiprocessing as mp
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.environment.engine import AchtungEngine
+from src.players.alpha_beta_player import AlphaBetaPlayer
+from static.settings import ACTIONS
+
+# Compares the serial alpha-beta search with the root-parallel one on a fixed set of positions: the speedup for every
+# number of workers, and whether the root values are identical. Run from the repository root:
+#   python benchmarks/alpha_beta_parallel.py
+
+NUM_POSITIONS = 8
+POSITION_TICKS = 120  # ticks of random play before a position is taken
+NUM_PLAYERS = 3
+SEARCH_DEPTH = 3
+SEARCH_SEED = 0
+
+
+def get_benchmark_positions(num_positions=NUM_POSITIONS):
+    """ Returns engines paused POSITION_TICKS ticks into seeded games of random players, where player 0 is alive """
+    engines = []
+    seed = 0
+    while len(engines) < num_positions:
+        np.random.seed(seed)
+        random.seed(seed)
+        seed += 1
+        engine = AchtungEngine(training_mode=True)
+        engine.initialize(['r' for _ in range(NUM_PLAYERS)])
+        for tick in range(POSITION_TICKS):
+            if not tick % engine.action_sampling_rate:
+                engine.update_actions()
+            engine.tick()
+        if engine.state.alive[0]:
+            engines.append(engine)
+    return engines
+
+
+def search_positions(engines, num_workers, use_transposition_table=False):
+    """ Returns the root values of every position and the time it took to search all of them """
+    player = AlphaBetaPlayer(0, engines[0], SEARCH_DEPTH, use_transposition_table, seed=SEARCH_SEED,
+                             num_workers=num_workers)
+    all_values = []
+    total_time = 0
+    for engine in engines:
+        state = engine.state
+        player.update_opponents(state)
+        state.enable_hashing()
+        parallel_search = player.get_parallel_search(state) if num_workers > 0 else None  # starts the workers once
+        start = time.perf_counter()
+        if parallel_search is not None:
+            values = parallel_search.search_root(player, state, SEARCH_DEPTH)
+        else:
+            values = player.search_root(state, SEARCH_DEPTH, ACTIONS)
+        total_time += time.perf_counter() - start
+        all_values.append(values)
+    player.close()
+    return all_values, total_time
+
+
+if __name__ == '__main__':
+    engines = get_benchmark_positions()
+    serial_values, serial_time = search_positions(engines, 0)
+    print(f'{len(engines)} positions, depth {SEARCH_DEPTH}, {mp.cpu_count()} cores')
+    print(f'serial:    {serial_time:.2f}s')
+    num_workers = 1
+    while num_workers <= max(mp.cpu_count(), 2):
+        values, total_time = search_positions(engines, num_workers)
+        print(f'{num_workers} workers: {total_time:.2f}s, speedup {serial_time / total_time:.2f}, '
+              f'identical values: {values == serial_values}')
+        num_workers *= 2
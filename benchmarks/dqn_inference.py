@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from src.environment.training_environment import TrainingEnv
+from src.players.drl_player import DRLPlayer
+from double_dqn.fast_inference import NumpyDenseNet, CompiledNet
+from static.settings import FC_ARCHITECTURE_PATH, FC_WEIGHT_PATH, ITERATION_LENGTH
+
+# Measures the latency of a single DRL decision with the chosen fully connected agent: the forward pass alone with every
+# inference path, and the whole DRLPlayer.get_action (features and forward pass) of four players, against the frame
+# budget of ITERATION_LENGTH milliseconds. Run from the repository root:
+#   python benchmarks/dqn_inference.py
+
+NUM_CALLS = 500
+NUM_DRL_PLAYERS = 4
+
+
+def microseconds_per_call(function, *args):
+    function(*args)  # traces / warms up
+    start = time.perf_counter()
+    for _ in range(NUM_CALLS):
+        function(*args)
+    return (time.perf_counter() - start) / NUM_CALLS * 1e6
+
+
+if __name__ == '__main__':
+    game = TrainingEnv(['r' for _ in range(NUM_DRL_PLAYERS)], training_mode=True)
+    for i in range(NUM_DRL_PLAYERS):
+        game.set_player(i, FC_ARCHITECTURE_PATH, FC_WEIGHT_PATH)
+    model = game.players[0]._net
+    state = game.state.adjust_to_drl_player(0)[np.newaxis, ...].astype(np.float32)
+    numpy_net, compiled_net = NumpyDenseNet(model), CompiledNet(model)
+    print(f'max difference from keras: numpy {np.abs(numpy_net(state) - model.predict(state, verbose=0)).max():.2e}, '
+          f'compiled {np.abs(compiled_net(state) - model.predict(state, verbose=0)).max():.2e}')
+    print('forward pass of one state:')
+    for name, function in [('model.predict', lambda x: model.predict(x, verbose=0)),
+                           ('model(x)', lambda x: model(x, training=False)),
+                           ('compiled tf.function', compiled_net), ('numpy', numpy_net)]:
+        print(f'  {name:22} {microseconds_per_call(function, state):8.1f}us')
+
+    def decide():
+        for player in game.players:
+            player.get_action(game.state)
+
+    tick_time = microseconds_per_call(decide)
+    print(f'{NUM_DRL_PLAYERS} DRLPlayer.get_action: {tick_time:.1f}us per sampling tick, '
+          f'{tick_time / (ITERATION_LENGTH * 1e3):.1%} of the {ITERATION_LENGTH}ms frame')
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from matplotlib import pyplot as plt
+
+from src.environment.training_environment import TrainingEnv
+from src.agent_training.drl_trainer import build_small_fc_model
+from double_dqn.agent import DQNAgent
+
+# Measures the training throughput of the DQN on the setup of drl_trainer.train_agent: the updates per second of
+# DoubleDQN.fit against the previous update (three Keras predict calls and a 10 epochs Keras fit per batch), and the
+# environment steps per second of DQNAgent.train for a few train-every-K schedules. Run from the repository root:
+#   python benchmarks/dqn_train_step.py
+
+BATCH_SIZE = 128
+NUM_UPDATES = 50
+EPISODES = 5
+TRAIN_EVERY = [1, 4, 16]
+
+
+def keras_fit(net, states, actions, next_states, rewards, legal_actions, dones):
+    """ The update DoubleDQN.fit did before it was compiled to a single graph """
+    targets = net.predict(states, legal_actions)
+    terminal_mask = np.flatnonzero(dones)
+    non_terminal_mask = np.flatnonzero(np.logical_not(dones))
+    targets[terminal_mask, actions[terminal_mask]] = rewards[terminal_mask]
+    t = net.target_net.predict(next_states[non_terminal_mask], verbose=0)
+    q = net.q_net.predict(next_states[non_terminal_mask], verbose=0)
+    estimated_values = t[np.arange(t.shape[0]), np.argmax(q, axis=-1)]
+    targets[non_terminal_mask, actions[non_terminal_mask]] = rewards[non_terminal_mask] + net.discount * estimated_values
+    net.q_net.fit(states, targets, epochs=10, verbose=0)
+
+
+def get_agent(**kwargs):
+    game = TrainingEnv(['r'], training_mode=True, with_positions=True)
+    agent = DQNAgent(game, **kwargs)
+    agent.set_model(build_small_fc_model(agent.get_state_shape(), agent.get_action_shape()))
+    return agent
+
+
+def fill_replay(agent, num_experiences):
+    """ Adds experiences of random play to the replay of agent """
+    state = agent.env.get_state()
+    for _ in range(num_experiences):
+        action = agent.get_action(state, 1.0)
+        next_state, reward = agent.env.step(action)
+        agent.exp_rep.add(state, action, reward, next_state, agent.env.get_legal_actions(state))
+        if next_state is None:
+            agent.env.reset()
+            next_state = agent.env.get_state()
+        state = next_state
+
+
+def updates_per_second(fit, agent):
+    fit(*agent.exp_rep.get_batch(BATCH_SIZE))  # traces / warms up
+    start = time.perf_counter()
+    for _ in range(NUM_UPDATES):
+        fit(*agent.exp_rep.get_batch(BATCH_SIZE))
+    return NUM_UPDATES / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    plt.switch_backend('Agg')
+    agent = get_agent()
+    fill_replay(agent, 2 * BATCH_SIZE)
+    before = updates_per_second(lambda *batch: keras_fit(agent.net, *batch), agent)
+    after = updates_per_second(agent.net.fit, agent)
+    print(f'updates per second: keras predict + 10 epochs fit {before:.1f}, compiled train step {after:.1f} '
+          f'({after / before:.1f}x)')
+    for train_every in TRAIN_EVERY:
+        agent = get_agent(train_every=train_every)
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            start = time.perf_counter()
+            rewards, num_actions = agent.train(EPISODES, checkpoint_dir, checkpoint_dir + os.path.sep, None, BATCH_SIZE)
+            run_time = time.perf_counter() - start
+        plt.close('all')
+        print(f'train every {train_every} steps: {np.sum(num_actions) / run_time:.1f} environment steps per second')
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import tensorflow as tf
+from matplotlib import pyplot as plt
+
+from src.environment.training_environment import TrainingEnv
+from src.agent_training.drl_trainer import build_small_fc_model
+from double_dqn.agent import DQNAgent
+from double_dqn.experience_replay import ExperienceReplay
+from double_dqn.prioritized_replay import PrioritizedExperienceReplay
+
+# Compares the sample efficiency of uniform and prioritized experience replay on the setup of drl_trainer.train_agent:
+# a single random opponent, the small fully connected model and batches of 128. For every seed both replays train from
+# the same initial weights, and the benchmark reports the number of environment steps until the moving average of the
+# episode rewards first reaches TARGET_FRACTION of the best moving average of the uniform run, and the average reward
+# of the last episodes. Run from the repository root (slow, every environment step is a training step):
+#   python benchmarks/replay_sample_efficiency.py [episodes] [seeds]
+
+EPISODES = 300
+SEEDS = 3
+BATCH_SIZE = 128
+WINDOW = 50  # episodes in the moving average
+TARGET_FRACTION = 0.9
+
+
+def train(replay, seed, episodes):
+    """ Returns the reward and the number of steps of every training episode """
+    np.random.seed(seed)
+    random.seed(seed)
+    tf.random.set_seed(seed)
+    game = TrainingEnv(['r'], training_mode=True, with_positions=True)
+    agent = DQNAgent(game, exp_rep=replay)
+    agent.set_model(build_small_fc_model(agent.get_state_shape(), agent.get_action_shape()))
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        rewards, num_actions = agent.train(episodes, checkpoint_dir, checkpoint_dir + os.path.sep, None, BATCH_SIZE)
+    plt.close('all')
+    return np.array(rewards), np.array(num_actions)
+
+
+def steps_to_target(rewards, num_actions, target):
+    """ Returns the number of steps until the moving average of the rewards reaches target, None if it never does """
+    window = min(WINDOW, len(rewards))
+    averages = np.convolve(rewards, np.ones(window) / window, mode='valid')
+    reached = np.flatnonzero(averages >= target)
+    if reached.size == 0:
+        return None
+    return int(np.sum(num_actions[:reached[0] + window]))
+
+
+if __name__ == '__main__':
+    plt.switch_backend('Agg')
+    episodes = int(sys.argv[1]) if len(sys.argv) > 1 else EPISODES
+    seeds = int(sys.argv[2]) if len(sys.argv) > 2 else SEEDS
+    window = min(WINDOW, episodes)
+    for seed in range(seeds):
+        start = time.perf_counter()
+        uniform = train(ExperienceReplay(), seed, episodes)
+        uniform_time = time.perf_counter() - start
+        start = time.perf_counter()
+        prioritized = train(PrioritizedExperienceReplay(), seed, episodes)
+        prioritized_time = time.perf_counter() - start
+        target = TARGET_FRACTION * np.convolve(uniform[0], np.ones(window) / window, mode='valid').max()
+        print(f'seed {seed}, {episodes} episodes, target moving average {target:.2f}')
+        for name, (rewards, num_actions), run_time in [('uniform', uniform, uniform_time),
+                                                       ('prioritized', prioritized, prioritized_time)]:
+            print(f'  {name:12} steps to target: {steps_to_target(rewards, num_actions, target)}, '
+                  f'last {window} episodes average: {rewards[-window:].mean():.2f}, '
+                  f'total steps: {num_actions.sum()}, time: {run_time:.1f}s')
@@ -0,0 +1,190 @@
+import os
+import sys
+import gc
+import copy
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.environment.engine import AchtungEngine
+from src.environment.state import State
+from src.players.player_factory import PlayerFactory, MIN_MAX_DEPTH
+from src.players.alpha_beta_player import AlphaBetaPlayer, AlphaBetaHeuristic
+from static.settings import *
+
+# The benchmark suite of the hot paths of the game: the engine tick, State.from_state, State.draw_circle, collision
+# detection, the ray features of the DRL players (NUM_RAYS rays of up to MAX_RAY_DISTANCE, for one player and for all
+# of them in one pass), the alpha-beta heuristic, get_action of the computer players (as the game creates them) and a
+# full alpha-beta search to MIN_MAX_DEPTH without a time budget, on canned mid-game
+# positions (sparse and dense boards, 1 to 4 players), generated from fixed seeds. Every benchmark reports operations
+# per second, p50 / p99 latency and the peak memory allocated by one operation, and the results can be written to a
+# JSON baseline and compared against one. Run from the repository root:
+#   python benchmarks/suite.py [--output baseline.json] [--compare baseline.json] [--filter tick]
+
+POSITIONS = {'sparse': 40, 'dense': 300}  # ticks of random play before the position is taken
+PLAYER_COUNTS = [1, 2, 3, 4]
+PLAYER_TYPES = ['r', 'd', 'ab']  # the human players need a keyboard
+MIN_ITERATIONS = 5
+MAX_ITERATIONS = 2000
+MIN_TIME = 0.5  # seconds per benchmark, once MIN_ITERATIONS are done
+MEMORY_ITERATIONS = 3
+RESTORE_RATE = 50  # ticks of the tick benchmark before the position is restored
+SEED = 0
+REGRESSION_TOLERANCE = 0.25  # a p50 latency more than 25% above the baseline is a regression
+
+
+def get_position(num_players, ticks):
+    """ Returns an engine paused ticks ticks into the first seeded game of random players where player 0 survives """
+    for seed in range(SEED, SEED + 1000):
+        np.random.seed(seed)
+        random.seed(seed)
+        engine = AchtungEngine(training_mode=True)
+        engine.initialize(['r' for _ in range(num_players)])
+        for tick in range(ticks):
+            if not tick % engine.action_sampling_rate:
+                engine.update_actions()
+            engine.tick()
+            if not engine.state.alive[0]:
+                break
+        if engine.state.alive[0]:
+            return engine
+    raise RuntimeError(f'no game of {num_players} players where player 0 survives {ticks} ticks')
+
+
+def get_benchmarks(engine):
+    """
+    Returns the benchmarks of a position: a dict from a name to a function that returns the operation to time (a
+    function of no arguments), or a pair of an untimed setup run before every operation and the operation. Operations
+    that change the position run on a copy of it.
+    """
+    state = engine.state
+    position, angle = state.get_position(0), state.get_angle(0)
+    head = engine.get_head_position(position, angle)
+
+    def tick():
+        copies = [None, RESTORE_RATE]
+
+        def setup():
+            if copies[1] >= RESTORE_RATE or not copies[0].state.alive[0]:
+                copies[:] = [copy.deepcopy(engine), 0]
+            copies[1] += 1
+        return setup, lambda: copies[0].tick()
+
+    def draw_circle():
+        new_state = State.from_state(state)
+        return lambda: new_state.draw_circle(2, position, PLAYER_RADIUS)
+
+    def score_function():
+        heuristic = AlphaBetaHeuristic(engine.players[0], engine)
+        opponents = list(range(1, len(engine.players)))
+        return lambda: heuristic.score_function(state, opponents)
+
+    benchmarks = {
+        'engine.tick': tick,
+        'State.from_state': lambda: lambda: State.from_state(state),
+        'State.draw_circle': draw_circle,
+        'AchtungEngine.detect_collision': lambda: lambda: engine.detect_collision(0, state, head),
+        'State.adjust_to_drl_player': lambda: lambda: state.adjust_to_drl_player(0),
+        'State.adjust_to_drl_players': lambda: lambda: state.adjust_to_drl_players(list(range(len(engine.players)))),
+        'AlphaBetaHeuristic.score_function': score_function,
+    }
+    for player_type in PLAYER_TYPES:
+        def get_action(player_type=player_type):
+            # a new player for every operation, or the alpha-beta player answers from its transposition table
+            players = [None]
+
+            def setup():
+                players[0] = PlayerFactory.create_player(player_type, 0, engine)
+            return setup, lambda: players[0].get_action(state)
+        benchmarks[f'get_action[{player_type}]'] = get_action
+
+    def search():
+        players = [None]
+
+        def setup():
+            players[0] = AlphaBetaPlayer(0, engine, MIN_MAX_DEPTH)
+        return setup, lambda: players[0].get_action(state)
+    benchmarks[f'AlphaBetaPlayer.search[depth {MIN_MAX_DEPTH}]'] = search
+    return benchmarks
+
+
+def measure(make_operation):
+    """ Returns the statistics of an operation: ops/sec, p50 and p99 latency and the peak memory of one operation """
+    np.random.seed(SEED)
+    random.seed(SEED)
+    operation = make_operation()
+    setup, operation = operation if isinstance(operation, tuple) else (lambda: None, operation)
+    setup()
+    operation()  # warm up caches and lazy initializations
+    latencies = []
+    start = time.perf_counter()
+    gc.disable()
+    try:
+        while len(latencies) < MAX_ITERATIONS and (len(latencies) < MIN_ITERATIONS or
+                                                    time.perf_counter() - start < MIN_TIME):
+            setup()
+            operation_start = time.perf_counter_ns()
+            operation()
+            latencies.append(time.perf_counter_ns() - operation_start)
+    finally:
+        gc.enable()
+    peak = 0
+    for _ in range(MEMORY_ITERATIONS):
+        setup()
+        tracemalloc.start()
+        operation()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    latencies = np.array(latencies) / 1e3
+    return {'ops_per_second': float(1e6 / latencies.mean()), 'p50_us': float(np.percentile(latencies, 50)),
+            'p99_us': float(np.percentile(latencies, 99)), 'peak_memory_bytes': int(peak),
+            'iterations': len(latencies)}
+
+
+def run_suite(name_filter=None):
+    results = {}
+    for position_name, ticks in POSITIONS.items():
+        for num_players in PLAYER_COUNTS:
+            engine = get_position(num_players, ticks)
+            for name, make_operation in get_benchmarks(engine).items():
+                key = f'{name}/{position_name}/{num_players}p'
+                if name_filter and name_filter not in key:
+                    continue
+                results[key] = measure(make_operation)
+                print(f'{key:55} {results[key]["ops_per_second"]:10.1f} ops/s  p50 {results[key]["p50_us"]:9.1f}us  '
+                      f'p99 {results[key]["p99_us"]:9.1f}us  peak {results[key]["peak_memory_bytes"] / 1024:8.1f}KiB')
+    return results
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """ Returns the benchmarks whose p50 latency regressed by more than tolerance, as (name, baseline, current) """
+    return [(name, baseline[name]['p50_us'], result['p50_us']) for name, result in results.items()
+            if name in baseline and result['p50_us'] > baseline[name]['p50_us'] * (1 + tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the hot paths of the game')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare the results with this JSON baseline')
+    parser.add_argument('--filter', help='only run the benchmarks whose name contains this string')
+    args = parser.parse_args()
+    results = run_suite(args.filter)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                                   'platform': platform.platform(), 'processor': platform.processor()},
+                       'seed': SEED, 'results': results}, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file)['results'])
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: p50 {before:.1f}us -> {after:.1f}us')
+        sys.exit(1 if regressions else 0)
@@ -4,14 +4,14 @@ import os, sys, inspect
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir)
-from double_dqn.agent import DQNAgent
+from double_dqn.agent import DQNAgent, METRICS_FILE
+from double_dqn.metrics import read_metrics
 from tqdm import tqdm
 from tensorflow.keras import Model
 from tensorflow.keras.layers import Dense, Input, Conv2D, MaxPool2D, ReLU, Dropout, Flatten, Concatenate, Multiply, Add, BatchNormalization
 from tensorflow.keras.models import load_model, model_from_json
 from matplotlib import pyplot as plt
 import json
-import pandas as pd
 
 
 def build_cnn_model(input_shape, output_shape) -> Model:
@@ -68,11 +68,11 @@ if __name__ == "__main__":
     game = TrainingEnv(['r', 'r'], [(), ()], training_mode=True)
     agent = DQNAgent(game)
     agent.set_model(build_cnn_model(agent.get_state_shape(), agent.get_action_shape()))
+    # every session is checkpointed in the background by agent.train, keeping the last and the best ones
+    checkpoint_dir = os.path.join(model_path, 'checkpoints')
     if start_session >= 1:
-        agent.net.q_net.load_weights(model_path + f'/session_{start_session}_weights')
-        agent.net.target_net.load_weights(model_path + f'/session_{start_session}_weights')
+        agent.resume(checkpoint_dir)
     config = agent.to_json()
-    accum_rewards = pd.DataFrame()
 
     # save model architecture
     with open(os.path.join(model_path, 'model_architecture'), 'w') as json_file:
@@ -90,18 +90,16 @@ if __name__ == "__main__":
                 model = model_from_json(json.load(json_file))
                 game.set_player(1, 'd', model)
         if i >= start_session + 1:
-            # Set players weights to be the trained weights from last session
-            game.players[1]._net.load_weights(model_path + f'/session_{i}_weights')
+            # Set players weights to be the trained weights from last session (copied in memory, not read back from disk)
+            game.players[1]._net.set_weights(agent.net.q_net.get_weights())
 
-        rewards, num_actions = agent.train(1, None, batch_size)
-
-        # Save all values that need to be saved
-        accum_rewards = accum_rewards.append(rewards)
-        agent.save_weights(os.path.join(model_path, f'session_{i + 1}_weights'))
-        with open(os.path.join(model_path, 'rewards.csv'), 'w') as reward_file:
-            accum_rewards.to_csv(reward_file)
+        rewards, num_actions = agent.train(1, weight_path=checkpoint_dir, checkpoint_path=model_path,
+                                           batch_size=batch_size, checkpoint_rate=1)
+        # the reward of every episode is appended to model_path/metrics.jsonl by agent.train
 
     # If we finished all training sessions, we plot the rewards for each episode played
+    accum_rewards = [record['reward'] for record in read_metrics(os.path.join(model_path, METRICS_FILE))
+                     if 'reward' in record]
     plt.scatter(range(1, len(accum_rewards) + 1), accum_rewards)
     plt.title('Reward achieved over training episodes')
     plt.xlabel('episode')
@@ -1,6 +1,9 @@
-from game.training_environment import TrainingEnv
+from src.environment.training_environment import TrainingEnv
 from static.settings import *
 from double_dqn.agent import DQNAgent
+from double_dqn.prioritized_replay import PrioritizedExperienceReplay
+from double_dqn.memmap_replay import MemmapExperienceReplay
+from double_dqn.actor_learner import ActorLearner
 from tensorflow.keras import Model
 from tensorflow.keras.layers import Dense, Input, Conv2D, MaxPool2D, ReLU, Dropout, Flatten
 from matplotlib import pyplot as plt
@@ -39,14 +42,32 @@ def build_small_fc_model(input_shape, output_shape, num_layers=3) -> Model:
     return fc_model
 
 
-def train_agent(architecture_path, weight_path, training_data_path, with_positions=True):
+def train_agent(architecture_path, weight_path, training_data_path, with_positions=True, prioritized_replay=False,
+                replay_path=None, resume=False):
+    """
+    :param replay_path: if given, the experiences are kept on disk in this directory (see MemmapExperienceReplay), and a
+                        replay left there by a previous run is resumed. The on-disk replay is uniform, so it can not be
+                        combined with prioritized_replay.
+    :param resume: continue the training from the latest checkpoint in weight_path.
+    """
+    if prioritized_replay and replay_path is not None:
+        raise ValueError('prioritized_replay and replay_path can not be combined: the prioritized replay is kept in '
+                         'memory only')
     game = TrainingEnv(['r'], training_mode=True, with_positions=with_positions)
-    agent = DQNAgent(game)
+    exp_rep = None
+    if prioritized_replay:
+        exp_rep = PrioritizedExperienceReplay()
+    elif replay_path is not None:
+        exp_rep = MemmapExperienceReplay(replay_path)
+    agent = DQNAgent(game, exp_rep=exp_rep)
     agent.set_model(build_small_fc_model(agent.get_state_shape(), agent.get_action_shape()))
     with open(architecture_path, 'w') as json_file:
         config = agent.to_json()
         json.dump(config, json_file)
-    rewards, num_actions = agent.train(10000, weight_path, training_data_path, None, 128)
+    trained_episodes = agent.resume(weight_path) if resume else 0
+    rewards, num_actions = agent.train(10000 - trained_episodes, weight_path, training_data_path, None, 128)
+    if isinstance(agent.exp_rep, MemmapExperienceReplay):
+        agent.exp_rep.close()
 
     # # Initiate data structures
     # training_sessions = 50
@@ -127,6 +148,24 @@ def train_agent(architecture_path, weight_path, training_data_path, with_positio
     plt.savefig(model_path + f'reward_plot')
     plt.show()
 
+
+def train_agent_actor_learner(architecture_path, weight_path, num_actors=4, num_updates=100000, with_positions=True,
+                              save_rate=10000):
+    """ Trains the agent of train_agent with actor processes playing the games while the learner trains """
+    game = TrainingEnv(['r'], training_mode=True, with_positions=with_positions)
+    agent = DQNAgent(game)
+    agent.set_model(build_small_fc_model(agent.get_state_shape(), agent.get_action_shape()))
+    with open(architecture_path, 'w') as json_file:
+        json.dump(agent.to_json(), json_file)
+    actor_learner = ActorLearner(agent, num_actors, with_positions)
+    try:
+        for i in range(0, num_updates, save_rate):
+            metrics = actor_learner.train(min(save_rate, num_updates - i))
+            print(', '.join(f'{name}: {value:.1f}' for name, value in metrics.items()))
+            agent.save_weights(weight_path + os.path.sep + f'update_{i + save_rate}_weights')
+    finally:
+        actor_learner.stop()
+
 #
 #
 # model_path = r"/content/drive/My Drive/AchtungDieKurve/models/colab_tryout_model_0_1_loss"
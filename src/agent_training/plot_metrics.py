@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from double_dqn.metrics import read_metrics
+
+# Offline plots of a training run from its metrics file (see double_dqn/metrics.py), so training itself never draws.
+# Usage, from the repository root:
+#   python src/agent_training/plot_metrics.py <metrics.jsonl> [output.png]
+
+AVERAGE_WINDOW = 100  # episodes
+PLOTTED_METRICS = [('reward', 'reward'), ('steps', 'steps per episode'), ('exploration_rate', 'exploration rate'),
+                   ('env_steps_per_second', 'environment steps per second'), ('fit_time', 'fit time per episode (s)'),
+                   ('replay_size', 'replay size')]
+
+
+def moving_average(values, window=AVERAGE_WINDOW):
+    """ Returns the average of every value and the window - 1 values before it (fewer at the start) """
+    sums = np.cumsum(np.insert(np.asarray(values, dtype=float), 0, 0))
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return (sums[1:] - sums[np.arange(1, len(values) + 1) - counts]) / counts
+
+
+def plot_metrics(metrics_path, output_path=None, window=AVERAGE_WINDOW):
+    """ Plots every metric of the episodes (and its moving average) against the episode number """
+    records = [record for record in read_metrics(metrics_path) if 'episode' in record]
+    names = [(name, title) for name, title in PLOTTED_METRICS if any(name in record for record in records)]
+    figure, axes = plt.subplots(len(names), 1, figsize=(10, 3 * len(names)), sharex=True, squeeze=False)
+    for axis, (name, title) in zip(axes[:, 0], names):
+        episodes = [record['episode'] for record in records if name in record]
+        values = [record[name] for record in records if name in record]
+        axis.plot(episodes, values, alpha=0.3)
+        axis.plot(episodes, moving_average(values, window))
+        axis.set_ylabel(title)
+    axes[-1, 0].set_xlabel('episode')
+    figure.tight_layout()
+    figure.savefig(output_path or os.path.splitext(metrics_path)[0] + '.png')
+    plt.close(figure)
+
+
+if __name__ == '__main__':
+    plot_metrics(*sys.argv[1:3])
@@ -0,0 +1,200 @@
+import time
+import random
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from double_dqn.fast_inference import NumpyDenseNet, dense_forward
+from src.environment.training_environment import TrainingEnv
+
+# Actor-learner training (as in Ape-X). Actor processes play TrainingEnv games with their own exploration rate and
+# stream their transitions, in chunks, through a queue into the replay of the learner, while the learner trains on the
+# replay without waiting for the games. The actors choose actions with a NumPy copy of the q-net (see
+# fast_inference.NumpyDenseNet), so they never run TensorFlow: the learner publishes its weights in shared memory every
+# sync_rate updates, and the actors copy them when the version changes. The actors are forked, so they inherit the
+# imported modules instead of importing TensorFlow again.
+
+NUM_ACTORS = 4
+CHUNK_SIZE = 32  # transitions per message of an actor
+SYNC_RATE = 50  # learner updates between publications of the weights
+TARGET_UPDATE_RATE = 250  # learner updates between alignments of the target net
+METRICS_RATE = 5.0  # seconds between entries of metrics_history
+EPSILON_BASE = 0.4  # actor i explores with probability EPSILON_BASE ** (1 + EPSILON_ALPHA * i / (num_actors - 1))
+EPSILON_ALPHA = 7
+
+
+class ActorLearner(object):
+
+    def __init__(self, agent, num_actors=NUM_ACTORS, with_positions=True, sync_rate=SYNC_RATE,
+                 target_update_rate=TARGET_UPDATE_RATE, chunk_size=CHUNK_SIZE, seed=0, metrics=None):
+        """
+        :param agent: a DQNAgent with its model set. Its replay, net and update schedule (gradient_steps) are used by
+                      the learner.
+        :param metrics: an optional MetricsWriter, which gets every entry of metrics_history.
+        """
+        if not NumpyDenseNet.supports(agent.net.q_net):
+            raise ValueError('the actors only run models of dense layers')
+        self.agent = agent
+        self.num_actors = num_actors
+        self.with_positions = with_positions
+        self.sync_rate = sync_rate
+        self.target_update_rate = target_update_rate
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.policy = NumpyDenseNet(agent.net.q_net)
+        self.updates = 0
+        self.metrics_history = []
+        self.metrics = metrics
+        self._actors = []
+        self._shm = None
+
+    def get_epsilons(self):
+        if self.num_actors == 1:
+            return [EPSILON_BASE]
+        return [EPSILON_BASE ** (1 + EPSILON_ALPHA * i / (self.num_actors - 1)) for i in range(self.num_actors)]
+
+    def start(self):
+        """publishes the weights and starts the actors"""
+        layout = [(kernel.shape, bias.shape, activation) for kernel, bias, activation in self.policy.layers]
+        size = sum(kernel.nbytes + bias.nbytes for kernel, bias, _ in self.policy.layers)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._weights = np.ndarray(size // 4, dtype=np.float32, buffer=self._shm.buf)
+        self._version = mp.Value('i', 0)
+        self._lock = mp.Lock()
+        self._env_steps = mp.Value('q', 0)
+        self._stop = mp.Event()
+        self._transitions = mp.Queue(maxsize=64 * self.num_actors)
+        self.publish_weights()
+        for i, epsilon in enumerate(self.get_epsilons()):
+            actor = mp.Process(target=_run_actor, daemon=True,
+                               args=(epsilon, layout, self._shm.name, self._version, self._lock, self._transitions,
+                                     self._env_steps, self._stop, self.chunk_size, self.with_positions, self.seed + i))
+            actor.start()
+            self._actors.append(actor)
+
+    def publish_weights(self):
+        self.policy.sync()
+        with self._lock:
+            offset = 0
+            for kernel, bias, _ in self.policy.layers:
+                for array in (kernel, bias):
+                    self._weights[offset:offset + array.size] = array.ravel()
+                    offset += array.size
+            self._version.value += 1
+
+    def drain(self):
+        """moves the transitions sent by the actors into the replay. Returns the number of transitions"""
+        added = 0
+        while True:
+            try:
+                chunk = self._transitions.get_nowait()
+            except queue.Empty:
+                return added
+            self.agent.exp_rep.add_batch(*chunk)
+            added += len(chunk[1])
+
+    def train(self, num_updates, batch_size=128):
+        """
+        Trains the learner for num_updates updates (of agent.gradient_steps batches each) while the actors play. The
+        actors are started on the first call and keep playing until stop().
+        :return: the metrics of the run, see get_metrics
+        """
+        if not self._actors:
+            self.start()
+        start, start_steps, start_updates = time.perf_counter(), self._env_steps.value, self.updates
+        last_report = (start, start_steps, start_updates)
+        target = self.updates + num_updates
+        while self.updates < target:
+            self.drain()
+            if self.agent.exp_rep.get_num() < batch_size:
+                time.sleep(0.01)
+                continue
+            self.agent.update_net(batch_size)
+            self.updates += 1
+            if not self.updates % self.target_update_rate:
+                self.agent.net.align_target_model()
+            if not self.updates % self.sync_rate:
+                self.publish_weights()
+            if time.perf_counter() - last_report[0] >= METRICS_RATE:
+                self.metrics_history.append(self.get_metrics(*last_report))
+                if self.metrics is not None:
+                    self.metrics.write(updates=self.updates, **self.metrics_history[-1])
+                last_report = (time.perf_counter(), self._env_steps.value, self.updates)
+        return self.get_metrics(start, start_steps, start_updates)
+
+    def get_metrics(self, since, env_steps, updates):
+        """
+        Returns the throughput since the given time, number of environment steps and number of updates: environment
+        steps and frames (ticks, action_sampling_rate per step) per second of all actors, and learner updates per second
+        """
+        elapsed = max(time.perf_counter() - since, 1e-9)
+        steps = self._env_steps.value - env_steps
+        return {'env_steps_per_second': steps / elapsed,
+                'env_frames_per_second': steps * self.agent.env.action_sampling_rate / elapsed,
+                'learner_updates_per_second': (self.updates - updates) / elapsed,
+                'replay_size': self.agent.exp_rep.get_num()}
+
+    def stop(self):
+        self._stop.set()
+        self.drain()
+        for actor in self._actors:
+            actor.join(timeout=5)
+            if actor.is_alive():  # blocked on a full queue
+                actor.terminate()
+        self._actors = []
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _run_actor(epsilon, layout, shm_name, version, lock, transitions, env_steps, stop, chunk_size, with_positions,
+               seed):
+    """ The loop of an actor process: plays games and sends chunks of transitions until stop is set """
+    np.random.seed(seed)
+    random.seed(seed)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    weights = np.ndarray(shm.size // 4, dtype=np.float32, buffer=shm.buf)
+    env = TrainingEnv(['r'], training_mode=True, with_positions=with_positions)
+    layers, seen_version = None, None
+    chunk = []
+    state = env.get_state()
+    while not stop.is_set():
+        if version.value != seen_version:
+            with lock:
+                seen_version = version.value
+                layers, offset = [], 0
+                for kernel_shape, bias_shape, activation in layout:
+                    kernel_size, bias_size = int(np.prod(kernel_shape)), int(np.prod(bias_shape))
+                    kernel = weights[offset:offset + kernel_size].reshape(kernel_shape).copy()
+                    bias = weights[offset + kernel_size:offset + kernel_size + bias_size].copy()
+                    layers.append((kernel, bias, activation))
+                    offset += kernel_size + bias_size
+        legal_actions = env.get_legal_actions(state)
+        if np.random.random() < epsilon:
+            action = np.random.choice(np.flatnonzero(legal_actions))
+        else:
+            q_values = np.where(legal_actions, dense_forward(layers, state[np.newaxis, ...])[0], -np.inf)
+            action = np.random.choice(np.flatnonzero(q_values == np.max(q_values)))
+        next_state, reward = env.step(action)
+        chunk.append((state, action, reward, np.zeros_like(state) if next_state is None else next_state,
+                      legal_actions, next_state is None))
+        with env_steps.get_lock():
+            env_steps.value += 1
+        if next_state is None:
+            env.reset()
+            next_state = env.get_state()
+        state = next_state
+        if len(chunk) == chunk_size:
+            states, actions, rewards, next_states, legal, dones = zip(*chunk)
+            chunk = []
+            message = (np.array(states), np.array(actions), np.array(rewards), np.array(next_states), np.array(legal),
+                       np.array(dones))
+            while not stop.is_set():
+                try:
+                    transitions.put(message, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    transitions.cancel_join_thread()  # the learner does not read the last chunks once stopped
+    shm.close()
@@ -1,20 +1,28 @@
 import os
+import time
 import numpy as np
-import pandas as pd
 from tqdm import tqdm
 from double_dqn.double_dqn import DoubleDQN
 from double_dqn.experience_replay import ExperienceReplay
+from double_dqn.metrics import MetricsWriter
+from double_dqn.checkpoints import CheckpointManager
 from tensorflow.keras.models import load_model, model_from_json
-from matplotlib import pyplot as plt
+
+METRICS_FILE = 'metrics.jsonl'
 
 
 class DQNAgent:
     def __init__(self, env, net_update_rate: int = 25, exploration_rate: float = 1.0,
-                 exploration_decay: float = 0.000001):
+                 exploration_decay: float = 0.000001, exp_rep: ExperienceReplay = None, train_every: int = 1,
+                 gradient_steps: int = 1):
         # set hyper parameters
         self.exploration_rate = exploration_rate
         self.exploration_decay = exploration_decay
         self.net_updating_rate = net_update_rate
+        self.train_every = train_every  # the net is updated every train_every environment steps
+        self.gradient_steps = gradient_steps  # the number of batches the net is trained on in every update
+        self.env_steps = 0
+        self.episodes = 0
 
         # set environment
         self.env = env
@@ -22,8 +30,9 @@ class DQNAgent:
         self.action_shape = self.env.get_legal_actions(self.env.get_state()).shape
 
         # the number of experience per batch for batch learning
-        # Experience Replay for batch learning
-        self.exp_rep = ExperienceReplay()
+        # Experience Replay for batch learning (uniform unless another replay, e.g. a PrioritizedExperienceReplay, is
+        # given)
+        self.exp_rep = ExperienceReplay() if exp_rep is None else exp_rep
 
         # Deep Q Network
         self.net = None
@@ -43,18 +52,52 @@ class DQNAgent:
 
         return np.random.choice(np.flatnonzero(legal_actions))
 
+    def get_actions(self, states: np.ndarray, legal_actions: np.ndarray, eps) -> np.ndarray:
+        """Batched version of get_action. Each state gets a random legal action with probability eps, and
+           argmax(q_net(state)) with probability 1-eps. Ties are broken at random."""
+        q_values = self.net.predict(states, legal_actions)
+        scores = np.where(q_values == np.max(q_values, axis=1, keepdims=True), 1.0, 0.0)
+        explore = np.random.random(len(states)) < eps
+        scores[explore] = 1.0
+        scores = np.where(legal_actions, scores + np.random.random(scores.shape), -np.inf)
+        return np.argmax(scores, axis=1)
+
+    def collect(self, batched_env, num_steps: int, eps) -> int:
+        """
+        Plays num_steps steps in every game of a BatchedAchtungEnv and stores all transitions in the experience replay.
+        Finished games are restarted automatically.
+        :return: the number of transitions added.
+        """
+        states = batched_env.get_states()
+        added = 0
+        for _ in range(num_steps):
+            legal_actions = batched_env.get_legal_actions(states)
+            actions = self.get_actions(states, legal_actions, eps)
+            next_states, rewards, dones = batched_env.step(actions)
+            self.exp_rep.add_batch(states, actions, rewards, next_states, legal_actions, dones)
+            added += len(actions)
+            done_games = np.flatnonzero(dones)
+            next_states[done_games] = batched_env.reset(done_games)
+            states = next_states
+        return added
+
     def update_net(self, batch_size: int):
         """ if there are more than batch_size experiences, Optimizes the network's weights using the Double-Q-learning
-         algorithm with a batch of experiences, else returns"""
+         algorithm with gradient_steps batches of experiences, else returns"""
         if self.exp_rep.get_num() < batch_size:
             return
-        batch = self.exp_rep.get_batch(batch_size)
-        self.net.fit(*batch)
+        for _ in range(self.gradient_steps):
+            batch, indices, weights = self.exp_rep.sample(batch_size)
+            td_errors = self.net.fit(*batch, weights=weights)
+            self.exp_rep.update_priorities(indices, td_errors)
 
     def train(self, episodes: int, weight_path, checkpoint_path, max_actions: int = None, batch_size: int = 64,
               checkpoint_rate=100):
         """
-        Runs a training session for the agent
+        Runs a training session for the agent. Every episode is appended to checkpoint_path/metrics.jsonl (reward,
+        steps, exploration rate, environment steps per second, time spent fitting and replay size, see MetricsWriter).
+        Every checkpoint_rate episodes a checkpoint is written to weight_path in the background (see CheckpointManager),
+        scored by the average reward of the episodes since the previous one. Use resume to continue from it.
         :param episodes: number of episodes to train.
         :param max_actions: max number of steps in an episode. if 0, each episode runs until reaching a terminal state.
         :param batch_size: number of experiences to learn from in each net_update.
@@ -68,61 +111,75 @@ class DQNAgent:
 
         # set hyper parameters
         exploration_rate = self.exploration_rate
-        total_rewards, average_reward_over_100 = [], []
+        total_rewards = []
         num_actions = []
+        metrics = MetricsWriter(os.path.join(checkpoint_path, METRICS_FILE))
+        checkpoints = CheckpointManager(weight_path)
         # start training
-        for i in tqdm(range(episodes)):
-            self.env.reset()  # Reset the environment for a new episode
-            state = self.env.get_state()  # Get starting state
-            step = 0
-            ep_reward = 0
-            while max_actions is None or step <= max_actions:
-
-                step += 1
-                action = self.get_action(state, exploration_rate)
-                next_state, reward = self.env.step(action)
-
-                ep_reward += reward
-                # Add experience to memory
-                self.exp_rep.add(state, action, reward, next_state, self.env.get_legal_actions(state))
-                self.update_net(batch_size)  # Optimize the DoubleQ-net
-                # if not step % 20:
-                if next_state is None:  # The action taken led to a  terminal state
-                    break
-                if (step % self.net_updating_rate) == 0:
-                    # update target network
-                    self.net.align_target_model()
-
-                state = next_state
-
-            # Update total_rewards and num_actions to keep track of progress
-            total_rewards.append(ep_reward)
-            num_actions.append(step)
-            # Update target network at the end of the episode
-            self.net.align_target_model()
-            if self.exp_rep.get_num() > batch_size:
-                if (i % 50) == 0 and i >= 100:
-                    average_reward_over_100.append(np.mean(total_rewards[-100:]))
-                if (i % checkpoint_rate) == 0:
-                    self.save_weights(weight_path + os.path.sep + f'episode_{i}_weights')
-                    with open(checkpoint_path + os.path.sep + 'total_rewards.csv', 'w') as reward_file:
-                        rewards = pd.DataFrame(total_rewards)
-                        rewards.to_csv(reward_file)
-                    with open(checkpoint_path + os.path.sep + 'exploration_rate', 'w') as exp_rate:
-                        exp_rate.writelines([str(exploration_rate)])
-                    plt.plot(np.arange(len(average_reward_over_100)), average_reward_over_100)
-                    plt.title('average reward over last 100 episodes')
-                    plt.xticks = 10 + (np.arange(len(average_reward_over_100)) * 5)
-                    plt.xlabel('episodes / 10')
-                    plt.ylabel('average reward over last 100 episodes')
-                    plt.savefig(checkpoint_path + 'average_100')
-                    plt.show()
-
-            # Update exploration rate
-            exploration_rate = max(0.1, 0.01 + (exploration_rate - 0.01) * np.exp(-self.exploration_decay * (i + 1)))
-        self.exploration_rate = exploration_rate
+        try:
+            for _ in tqdm(range(episodes)):
+                episode_start = time.perf_counter()
+                fit_time = 0
+                self.env.reset()  # Reset the environment for a new episode
+                state = self.env.get_state()  # Get starting state
+                step = 0
+                ep_reward = 0
+                while max_actions is None or step <= max_actions:
+
+                    step += 1
+                    action = self.get_action(state, exploration_rate)
+                    next_state, reward = self.env.step(action)
+
+                    ep_reward += reward
+                    # Add experience to memory
+                    self.exp_rep.add(state, action, reward, next_state, self.env.get_legal_actions(state))
+                    self.env_steps += 1
+                    if self.env_steps % self.train_every == 0:
+                        fit_start = time.perf_counter()
+                        self.update_net(batch_size)  # Optimize the DoubleQ-net
+                        fit_time += time.perf_counter() - fit_start
+                    # if not step % 20:
+                    if next_state is None:  # The action taken led to a  terminal state
+                        break
+                    if (step % self.net_updating_rate) == 0:
+                        # update target network
+                        self.net.align_target_model()
+
+                    state = next_state
+
+                # Update total_rewards and num_actions to keep track of progress
+                total_rewards.append(ep_reward)
+                num_actions.append(step)
+                # Update target network at the end of the episode
+                self.net.align_target_model()
+                metrics.write(episode=self.episodes, reward=float(ep_reward), steps=step,
+                              exploration_rate=float(exploration_rate),
+                              env_steps_per_second=step / (time.perf_counter() - episode_start), fit_time=fit_time,
+                              replay_size=self.exp_rep.get_num())
+                self.episodes += 1
+
+                # Update exploration rate, by the episodes trained so far (including those of a resumed run)
+                decay = np.exp(-self.exploration_decay * self.episodes)
+                exploration_rate = max(0.1, 0.01 + (exploration_rate - 0.01) * decay)
+                self.exploration_rate = exploration_rate
+                if self.exp_rep.get_num() > batch_size and (self.episodes % checkpoint_rate) == 0:
+                    checkpoints.save(self, self.episodes, np.mean(total_rewards[-checkpoint_rate:]))
+        finally:
+            metrics.close()
+            checkpoints.close()
         return total_rewards, num_actions
 
+    def resume(self, weight_path):
+        """
+        Restores the agent from the latest checkpoint that train wrote to weight_path: the weights, the optimizer state,
+        the exploration rate, the counters and the position of an on-disk replay.
+        :return: the number of episodes the agent was trained on, 0 if there is no checkpoint.
+        """
+        checkpoints = CheckpointManager(weight_path)
+        entry = checkpoints.restore(self)
+        checkpoints.close()
+        return 0 if entry is None else entry['episode']
+
     def get_state_shape(self):
         return self.state_shape
 
@@ -0,0 +1,150 @@
+import os
+import json
+import queue
+import threading
+
+import numpy as np
+
+from double_dqn.memmap_replay import MemmapExperienceReplay
+
+# Training checkpoints written in the background. save() only copies the weights of the nets and the optimizer state
+# to memory (cheap for the nets we train) and hands them to a writer thread, which writes them with NumPy, so training
+# never waits for the disk. The directory keeps the last keep_last checkpoints plus the keep_best ones with the highest
+# reward, and INDEX_FILE lists them. A checkpoint holds everything needed to resume training: the weights of both nets,
+# the optimizer state, the exploration rate, the episode and step counters, and the position of an on-disk replay.
+
+INDEX_FILE = 'checkpoints.json'
+KEEP_LAST = 3
+KEEP_BEST = 1
+
+
+def get_optimizer_variables(optimizer):
+    return optimizer.variables() if callable(optimizer.variables) else optimizer.variables
+
+
+class CheckpointManager(object):
+
+    def __init__(self, directory, keep_last=KEEP_LAST, keep_best=KEEP_BEST):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        os.makedirs(directory, exist_ok=True)
+        self.index = self.read_index()
+        self._queue = queue.Queue(maxsize=2)  # save() blocks only if the writer falls two checkpoints behind
+        self._error = None  # the first exception of the writer, raised by wait()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def read_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return []
+        with open(index_path) as index_file:
+            return json.load(index_file)
+
+    def save(self, agent, episode, reward):
+        """
+        Snapshots the agent and queues the snapshot for writing.
+        :param episode: the number of episodes the agent was trained on.
+        :param reward: the score of the checkpoint (e.g. the average reward of the last episodes), for keep_best.
+        """
+        arrays = {f'q_{i}': weights for i, weights in enumerate(agent.net.q_net.get_weights())}
+        arrays.update({f'target_{i}': weights for i, weights in enumerate(agent.net.target_net.get_weights())})
+        optimizer = agent.net.q_net.optimizer
+        arrays.update({f'optimizer_{i}': variable.numpy()
+                       for i, variable in enumerate(get_optimizer_variables(optimizer))})
+        meta = {'episode': int(episode), 'reward': float(reward), 'exploration_rate': float(agent.exploration_rate),
+                'env_steps': int(agent.env_steps)}
+        if isinstance(agent.exp_rep, MemmapExperienceReplay):
+            agent.exp_rep.flush()  # the replay on disk matches the checkpoint
+            meta['replay'] = {'num': agent.exp_rep.get_num(), 'next': agent.exp_rep._next}
+        self._queue.put((arrays, meta))
+
+    def wait(self):
+        """blocks until every queued checkpoint is written, and raises the error of a checkpoint that failed"""
+        self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self._queue.put(None)
+            self._writer.join()
+
+    def latest(self):
+        """ Returns the index entry of the latest written checkpoint, or None """
+        return max(self.index, key=lambda entry: entry['episode']) if self.index else None
+
+    def best(self):
+        """ Returns the index entry of the written checkpoint with the highest reward, or None """
+        return max(self.index, key=lambda entry: entry['reward']) if self.index else None
+
+    def restore(self, agent, entry=None):
+        """
+        Restores the agent from a checkpoint (the latest if entry is None), so its training can be resumed.
+        :return: the index entry of the checkpoint, or None if there is none.
+        """
+        self.wait()
+        entry = entry or self.latest()
+        if entry is None:
+            return None
+        with np.load(os.path.join(self.directory, entry['file'])) as arrays:
+            q_net, target_net = agent.net.q_net, agent.net.target_net
+            q_net.set_weights([arrays[f'q_{i}'] for i in range(len(q_net.weights))])
+            target_net.set_weights([arrays[f'target_{i}'] for i in range(len(target_net.weights))])
+            optimizer = q_net.optimizer
+            num_saved = sum(name.startswith('optimizer_') for name in arrays.files)
+            if len(get_optimizer_variables(optimizer)) != num_saved:
+                optimizer.build(q_net.trainable_variables)  # the slots are created lazily, on the first update
+            for i, variable in enumerate(get_optimizer_variables(optimizer)):
+                variable.assign(arrays[f'optimizer_{i}'])
+        agent.net.weights_changed()
+        agent.exploration_rate = entry['exploration_rate']
+        agent.episodes = entry['episode']
+        agent.env_steps = entry['env_steps']
+        if 'replay' in entry and isinstance(agent.exp_rep, MemmapExperienceReplay):
+            agent.exp_rep._num, agent.exp_rep._next = entry['replay']['num'], entry['replay']['next']
+        return entry
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            try:
+                self.write(*item)
+            except Exception as error:  # the writer keeps running, so wait() never blocks forever
+                if self._error is None:
+                    self._error = error
+            finally:
+                self._queue.task_done()
+
+    def write(self, arrays, meta):
+        meta['file'] = f'checkpoint_{meta["episode"]}.npz'
+        path = os.path.join(self.directory, meta['file'])
+        with open(path + '.tmp', 'wb') as checkpoint_file:
+            np.savez(checkpoint_file, **arrays)
+        os.replace(path + '.tmp', path)
+        self.index = [entry for entry in self.index if entry['file'] != meta['file']] + [meta]
+        self.apply_retention()
+
+    def apply_retention(self):
+        """ Deletes the checkpoints that are neither among the last keep_last nor the best keep_best """
+        by_episode = sorted(self.index, key=lambda entry: entry['episode'])
+        by_reward = sorted(self.index, key=lambda entry: entry['reward'])
+        kept = by_episode[len(by_episode) - self.keep_last:] + by_reward[len(by_reward) - self.keep_best:]
+        kept_files = {entry['file'] for entry in kept}
+        removed = [entry for entry in self.index if entry['file'] not in kept_files]
+        self.index = [entry for entry in by_episode if entry['file'] in kept_files]
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path + '.tmp', 'w') as index_file:
+            json.dump(self.index, index_file)
+        os.replace(index_path + '.tmp', index_path)
+        for entry in removed:  # deleted only once the index no longer lists them
+            path = os.path.join(self.directory, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
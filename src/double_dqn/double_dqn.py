@@ -1,8 +1,11 @@
+import tensorflow as tf
 from tensorflow.keras import Model
 from tensorflow.keras.layers import Dense, Input
 from tensorflow.keras.models import clone_model, load_model, model_from_json
 import numpy as np
 
+from double_dqn.fast_inference import get_inference_net
+
 
 class DoubleDQN:
     def __init__(self, model, discount: float = 0.95):
@@ -13,6 +16,9 @@ class DoubleDQN:
         self.discount = discount
         self.q_net = None
         self.target_net = None
+        self._train_step = None
+        self._inference_net = None
+        self._inference_synced = False  # whether the inference net has the current weights of the q-net
         self.set_model(model)
 
     def align_target_model(self):
@@ -31,66 +37,103 @@ class DoubleDQN:
                 state
         """
 
-        q_values = self.q_net.predict(states)
+        if not self._inference_synced:
+            self._inference_net.sync()
+            self._inference_synced = True
+        q_values = self._inference_net(states)
         illegal = np.where(np.logical_not(legal_actions))
         q_values[illegal[0], illegal[1]] = 0  # setting q_values of illegal actions to 0. TODO: Check maybe set to -inf
         return q_values
 
     def fit(self, states: np.ndarray, actions: np.ndarray, next_states: np.ndarray, rewards: np.ndarray,
-            legal_actions: np.ndarray):
+            legal_actions: np.ndarray, dones: np.ndarray = None, weights: np.ndarray = None) -> np.ndarray:
         """
-        Updates the net according to the Double Q-learning paradigm.
+        Updates the net according to the Double Q-learning paradigm, with one gradient step on the batch (the original
+        update was a Keras fit of 10 epochs in minibatches of 32 on the same batch; DQNAgent's gradient_steps sets the
+        number of batches of an update instead).
         :param states: A batch of states.
         :param actions: A batch of actions taken from the specified states.
         :param next_states: the observed next-states after taking the specified actions from the specified states
-                (Expects None if the state was a terminal state).
+                (ignored where dones is True).
         :param rewards: A batch of rewards given after taking soecified actions from specified states and transitioning
                 to specified next_states.
         :param legal_actions: A batch of legal actions that are allowed from the specified states.
+        :param dones: A batch of booleans, True where the state was a terminal state. If None, terminal next-states are
+                expected to be None.
+        :param weights: optional importance sampling weights of the experiences, used as sample weights of the loss.
+        :return: the TD errors of the batch: target - Q(state, action), before the update.
         """
         if self.q_net is None:
             raise NotImplementedError('model was not initiated')
-        targets = self.predict(states, legal_actions)
-        hist = np.histogram(np.argmax(targets, axis=1), bins=[-0.5, 0.5, 1.5, 2.5], density=True)[0]
-        # Create masks for separating terminal states from non terminal states.
-        terminal_mask = np.array([next_state is None for next_state in list(next_states)])
-        non_terminal_mask = np.logical_not(terminal_mask)
-        terminal_mask = np.where(terminal_mask)[0]
-        non_terminal_mask = np.where(non_terminal_mask)[0]
-
-        # Update the expected sum of rewards in the terminal states to be just the current reward
-        if terminal_mask.size > 0:
-            targets[terminal_mask, actions[terminal_mask]] = rewards[terminal_mask]
-
-        # Calculate the expected sum of rewards based on the target net and q net
-        t = self.target_net.predict(np.array(list(next_states[non_terminal_mask])))
-        q = self.q_net.predict(np.array(list(next_states[non_terminal_mask])))
-
-        # Double-Q learning paradigm. We choose the actions based on the q_net evaluation, but evaluate those chosen
-        # actions using the target net
-        max_actions = np.argmax(q, axis=-1)
-        estimated_values = t[np.arange(t.shape[0]), max_actions]
-        targets[non_terminal_mask, actions[non_terminal_mask]] = np.add(rewards[non_terminal_mask],
-                                                                        self.discount * estimated_values)
-
-        # At this point the target is similar to the q-net prediction, except in the index corresponding to action
-        # taken. In this index, the target value is just the reward if state is terminal, otherwise it is
-        # reward + discount * Q(next_state, action), where Q(next_state, action) is evaluated using the Double
-        # Q-learning algorithm. that is Q(next_state, action) = t_net(next_state)[argmax(q_net(next_state))]
-
-        self.q_net.fit(states, targets, epochs=10, verbose=0)
+        if dones is None:
+            dones = np.array([next_state is None for next_state in list(next_states)])
+            next_states = np.array([np.zeros_like(states[0]) if done else next_state
+                                    for done, next_state in zip(dones, next_states)], dtype=states.dtype)
+        if weights is None:
+            weights = np.ones(len(actions), dtype=np.float32)
+        td_errors = self._train_step(np.asarray(states, dtype=np.float32), np.asarray(actions, dtype=np.int32),
+                                     np.asarray(next_states, dtype=np.float32), np.asarray(rewards, dtype=np.float32),
+                                     np.asarray(legal_actions, dtype=bool), np.asarray(dones, dtype=bool),
+                                     np.asarray(weights, dtype=np.float32))
+        self.weights_changed()
+        return td_errors.numpy()
+
+    def weights_changed(self):
+        """must be called after the weights of the q-net are changed other than by fit (e.g. set_weights)"""
+        self._inference_synced = False
+
+    def build_train_step(self):
+        """
+        Compiles the update of fit to a single graph: the Q-values of the states and of the next states by both nets,
+        the Double-Q targets, and one gradient step of the q-net's optimizer on the q-net's compiled loss (mean squared
+        error if it was compiled without one), per experience and weighted by the importance sampling weights, like the
+        sample_weight of a Keras fit. The input signature has an unknown batch size, so the graph is traced once.
+        """
+        n_actions = self.q_net.output_shape[-1]
+        state_spec = tf.TensorSpec((None,) + tuple(self.q_net.input_shape[1:]), tf.float32)
+        signature = [state_spec, tf.TensorSpec((None,), tf.int32), state_spec, tf.TensorSpec((None,), tf.float32),
+                     tf.TensorSpec((None, n_actions), tf.bool), tf.TensorSpec((None,), tf.bool),
+                     tf.TensorSpec((None,), tf.float32)]
+        q_net, target_net, discount = self.q_net, self.target_net, self.discount
+        loss_function = get_per_sample_loss(q_net)
+
+        @tf.function(input_signature=signature)
+        def train_step(states, actions, next_states, rewards, legal_actions, dones, weights):
+            # Double-Q learning paradigm. We choose the next actions based on the q_net evaluation, but evaluate those
+            # chosen actions using the target net
+            max_actions = tf.argmax(q_net(next_states, training=False), axis=-1, output_type=tf.int32)
+            estimated_values = tf.gather(target_net(next_states, training=False), max_actions, batch_dims=1)
+            # the expected sum of rewards is just the current reward in terminal states
+            new_values = rewards + discount * tf.where(dones, 0.0, estimated_values)
+
+            # the target is the q-net prediction (0 for illegal actions), except in the index of the action taken
+            predictions = tf.where(legal_actions, q_net(states, training=False), 0.0)
+            taken = tf.one_hot(actions, tf.shape(predictions)[-1], on_value=True, off_value=False)
+            targets = tf.where(taken, new_values[:, tf.newaxis], predictions)
+            with tf.GradientTape() as tape:
+                q_values = q_net(states, training=True)
+                loss = tf.reduce_mean(weights * loss_function(targets, q_values))
+            gradients = tape.gradient(loss, q_net.trainable_variables)
+            q_net.optimizer.apply_gradients(zip(gradients, q_net.trainable_variables))
+            return new_values - tf.gather(predictions, actions, batch_dims=1)
+
+        self._train_step = train_step
 
     def set_model(self, model):
         self.q_net = model
         self.target_net = clone_model(self.q_net)
         self.target_net.set_weights(self.q_net.get_weights())
+        self._inference_net = get_inference_net(self.q_net)
+        self._inference_synced = True
+        self.build_train_step()
 
     # This handles saving\loading the model as explained here:
     # https://www.tensorflow.org/guide/keras/save_and_serialize (Ctrl+Left_click to open)
 
     def load_weights(self, path):
         self.q_net.load_weights(path)
-        self.target_net = clone_model(self.q_net)
+        self.weights_changed()
+        self.align_target_model()
 
     def save_weights(self, path):
         self.q_net.save_weights(path)
@@ -106,3 +149,12 @@ class DoubleDQN:
 
     def load_model(self, path):
         self.set_model(load_model(path))
+
+
+def get_per_sample_loss(model):
+    """ Returns the compiled loss of a model as a function of (targets, predictions) with a value per experience """
+    loss = tf.keras.losses.get(model.loss or 'mse')
+    if isinstance(loss, tf.keras.losses.Loss):
+        # a Loss object reduces over the batch by itself, a copy without reduction keeps the value of every experience
+        loss = loss.__class__.from_config({**loss.get_config(), 'reduction': tf.keras.losses.Reduction.NONE})
+    return loss
@@ -1,14 +1,34 @@
 import numpy as np
-from collections import namedtuple
-import random
-
-Transition = namedtuple('Transition', ('state', 'action', 'reward', 'next_state', 'legal_actions'))
 
 
 class ExperienceReplay:
-    def __init__(self, e_max=10000):
+    """
+    A ring buffer of experiences, stored in preallocated arrays: states[N, D], actions[N], rewards[N], next_states[N, D],
+    dones[N] and legal_actions[N, A]. Adding an experience overwrites the oldest one once the buffer is full. The arrays
+    are allocated on the first add, when the shapes of the states are known, so the memory used is fixed from then on:
+    N * (8 * D + A + 7) bytes with float32 states.
+    """
+
+    def __init__(self, e_max=10000, state_dtype=np.float32):
         self._max = e_max  # maximum number of experiences
-        self.transitions = []  # total experiences the Agent stored
+        self._num = 0  # current number of experiences
+        self._next = 0  # the index the next experience is written to
+        self.state_dtype = state_dtype
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.next_states = None
+        self.dones = None
+        self.legal_actions = None
+
+    def allocate(self, state_shape, num_actions):
+        """allocates the arrays of the buffer for states of the given shape"""
+        self.states = np.zeros((self._max,) + tuple(state_shape), dtype=self.state_dtype)
+        self.next_states = np.zeros((self._max,) + tuple(state_shape), dtype=self.state_dtype)
+        self.actions = np.zeros(self._max, dtype=np.int16)
+        self.rewards = np.zeros(self._max, dtype=np.float32)
+        self.dones = np.zeros(self._max, dtype=bool)
+        self.legal_actions = np.zeros((self._max, num_actions), dtype=bool)
 
     def get_max(self):
         """return the maximum number of experiences"""
@@ -16,29 +36,85 @@ class ExperienceReplay:
 
     def get_num(self):
         """return the current number of experiences"""
-        return len(self.transitions)
+        return self._num
+
+    def get_memory_size(self):
+        """return the number of bytes used by the arrays of the buffer"""
+        if self.states is None:
+            return 0
+        arrays = [self.states, self.actions, self.rewards, self.next_states, self.dones, self.legal_actions]
+        return sum(array.nbytes for array in arrays)
 
     def reset(self):
         """resets the memory, deleting all previous experiences"""
-        self.transitions = []
+        self._num = 0
+        self._next = 0
 
     def get_batch(self, batch_size: int):
-        """randomly choose a batch of experiences for training"""
+        """
+        randomly choose a batch of experiences for training
+        :return: a tuple (state, action, next_state, reward, legal_actions, done). The next states of terminal
+                 experiences (done) are zeros.
+        """
+        return self.sample(batch_size)[0]
+
+    def sample(self, batch_size: int):
+        """
+        randomly choose a batch of experiences for training
+        :return: a tuple (batch, indices, weights). batch is the tuple returned by get_batch, indices are the indices of
+                 the experiences (for update_priorities) and weights are their importance sampling weights, None when
+                 sampling uniformly.
+        """
+        indices = self.sample_indices(batch_size)
+        return self.get_experiences(indices), indices, None
+
+    def update_priorities(self, indices, td_errors):
+        """update the priorities of sampled experiences given their TD errors. Uniform sampling ignores them"""
+        pass
+
+    def on_add(self, indices):
+        """called with the indices of every added experience"""
+        pass
+
+    def sample_indices(self, batch_size: int):
         if batch_size < self.get_num():  # We must sample with replacements
-            batch = random.choices(self.transitions, k=batch_size)
-        else:
-            batch = random.sample(self.transitions, k=batch_size)
-        batch = Transition(*zip(*batch))
-        state = np.array(batch.state)
-        action = np.array(batch.action)
-        reward = np.array(batch.reward)
-        next_state = np.array(batch.next_state)
-        legal_actions = np.array(batch.legal_actions)
-        return state, action, next_state, reward, legal_actions
+            return np.random.randint(self.get_num(), size=batch_size)
+        return np.random.choice(self.get_num(), size=batch_size, replace=False)
+
+    def get_experiences(self, indices):
+        return (self.states[indices], self.actions[indices], self.next_states[indices], self.rewards[indices],
+                self.legal_actions[indices], self.dones[indices])
 
     def add(self, state, action, reward, next_state, legal_actions):
-        """remove the oldest experience if the memory is full"""
-        if self.get_num() > self.get_max():
-            del self.transitions[0]
-        """add single experience"""
-        self.transitions.append(Transition(state, action, reward, next_state, legal_actions))
+        """add single experience. next_state is None for terminal experiences"""
+        if self.states is None:
+            self.allocate(np.shape(state), len(legal_actions))
+        i = self._next
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = next_state is None
+        self.next_states[i] = 0 if next_state is None else next_state
+        self.legal_actions[i] = legal_actions
+        self.on_add(np.array([i]))
+        self._next = (self._next + 1) % self._max
+        self._num = min(self._num + 1, self._max)
+
+    def add_batch(self, states, actions, rewards, next_states, legal_actions, dones):
+        """add a batch of experiences. next_states of terminal experiences (dones) are ignored"""
+        if self.states is None:
+            self.allocate(np.shape(states)[1:], np.shape(legal_actions)[1])
+        n = min(len(actions), self._max)  # only the last _max experiences of a huge batch are kept
+        rows = slice(len(actions) - n, len(actions))
+        indices = (self._next + np.arange(n)) % self._max
+        dones = np.asarray(dones[rows], dtype=bool)
+        self.states[indices] = states[rows]
+        self.actions[indices] = actions[rows]
+        self.rewards[indices] = rewards[rows]
+        self.dones[indices] = dones
+        self.next_states[indices] = np.where(dones[:, np.newaxis], 0, next_states[rows].reshape(n, -1)).reshape(
+            (n,) + self.next_states.shape[1:])
+        self.legal_actions[indices] = legal_actions[rows]
+        self.on_add(indices)
+        self._next = (self._next + n) % self._max
+        self._num = min(self._num + n, self._max)
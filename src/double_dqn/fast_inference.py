@@ -0,0 +1,72 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Dense, Dropout, InputLayer
+
+# Low latency Q-values of a few states. Every Keras call (model.predict, or even model(x)) costs hundreds of
+# microseconds of overhead, far more than the arithmetic of the small dense nets of build_small_fc_model. Such nets are
+# evaluated with their weights exported to NumPy (a few matrix products), and any other model with a tf.function of a
+# fixed input signature, which is traced once.
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'sigmoid': lambda x: np.divide(1, 1 + np.exp(-x, out=x), out=x),
+}
+
+
+class NumpyDenseNet(object):
+    """
+    The inference forward pass of a chain of Dense layers (dropout is the identity at inference) in NumPy. The weights
+    are copied from the model, so sync() must be called after the model is trained.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.layers = []
+        self.sync()
+
+    @staticmethod
+    def supports(model):
+        return len(model.inputs) == 1 and all(
+            isinstance(layer, (InputLayer, Dropout)) or
+            (isinstance(layer, Dense) and layer.activation.__name__ in ACTIVATIONS) for layer in model.layers)
+
+    def sync(self):
+        """copies the current weights of the model"""
+        self.layers = [(layer.kernel.numpy(),
+                        layer.bias.numpy() if layer.use_bias else np.zeros(layer.units, dtype=np.float32),
+                        layer.activation.__name__) for layer in self.model.layers if isinstance(layer, Dense)]
+
+    def __call__(self, states):
+        return dense_forward(self.layers, states)
+
+
+class CompiledNet(object):
+    """ The inference forward pass of any single input model, as a tf.function traced once for all batch sizes """
+
+    def __init__(self, model):
+        spec = tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)
+        self._forward = tf.function(lambda states: model(states, training=False), input_signature=[spec])
+
+    def sync(self):
+        """the function reads the variables of the model, nothing to copy"""
+        pass
+
+    def __call__(self, states):
+        return self._forward(np.asarray(states, dtype=np.float32)).numpy()
+
+
+def dense_forward(layers, states):
+    """ The forward pass of a chain of dense layers, given as a list of tuples (kernel, bias, activation name) """
+    x = np.asarray(states, dtype=np.float32)
+    for kernel, bias, activation in layers:
+        x = ACTIVATIONS[activation](x @ kernel + bias)
+    return x
+
+
+def get_inference_net(model):
+    """ Returns the fastest forward pass of model: a callable from a batch of states to their Q-values """
+    if NumpyDenseNet.supports(model):
+        return NumpyDenseNet(model)
+    return CompiledNet(model)
@@ -0,0 +1,105 @@
+import os
+import json
+
+import numpy as np
+
+from double_dqn.experience_replay import ExperienceReplay
+
+# An experience replay stored on disk: every array of the ring buffer is a .npy file in a directory, mapped to memory
+# with np.lib.format.open_memmap, so the capacity is bounded by the disk and not by the RAM (the OS pages the files in
+# and out), and a batch read only touches the rows it samples. The number of experiences and the write position are
+# kept in META_FILE, which is rewritten (atomically) every FLUSH_RATE adds after the arrays are flushed, so a replay
+# reopened after a crash holds everything up to the last flush. Any number of processes may open the directory
+# read-only to sample from it while one process adds experiences; a reader sees the new experiences after refresh().
+
+META_FILE = 'meta.json'
+ARRAY_NAMES = ['states', 'next_states', 'actions', 'rewards', 'dones', 'legal_actions']
+FLUSH_RATE = 1000  # adds
+
+
+class MemmapExperienceReplay(ExperienceReplay):
+
+    def __init__(self, directory, e_max=10 ** 6, state_dtype=np.float32, read_only=False, flush_rate=FLUSH_RATE):
+        """
+        Opens the replay in directory, or creates a new one if there is none (the files are created on the first add).
+        :param e_max: the capacity of a new replay. An existing replay keeps its own capacity.
+        :param read_only: open an existing replay for sampling only.
+        """
+        super().__init__(e_max, state_dtype)
+        self.directory = directory
+        self.read_only = read_only
+        self.flush_rate = flush_rate
+        self._unflushed = 0
+        if os.path.exists(os.path.join(directory, META_FILE)):
+            self.open()
+        elif read_only:
+            raise FileNotFoundError(f'no replay in {directory}')
+
+    def allocate(self, state_shape, num_actions):
+        """creates the files of the replay for states of the given shape"""
+        os.makedirs(self.directory, exist_ok=True)
+        shapes = {'states': tuple(state_shape), 'next_states': tuple(state_shape), 'actions': (),
+                  'rewards': (), 'dones': (), 'legal_actions': (num_actions,)}
+        dtypes = {'states': self.state_dtype, 'next_states': self.state_dtype, 'actions': np.int16,
+                  'rewards': np.float32, 'dones': bool, 'legal_actions': bool}
+        for name in ARRAY_NAMES:
+            setattr(self, name, np.lib.format.open_memmap(self.get_path(name), mode='w+', dtype=dtypes[name],
+                                                          shape=(self._max,) + shapes[name]))
+        self.flush()
+
+    def open(self):
+        """maps the files of an existing replay"""
+        with open(os.path.join(self.directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        self._max, self._num, self._next = meta['max'], meta['num'], meta['next']
+        mode = 'r' if self.read_only else 'r+'
+        for name in ARRAY_NAMES:
+            setattr(self, name, np.lib.format.open_memmap(self.get_path(name), mode=mode))
+        self.state_dtype = self.states.dtype
+
+    def refresh(self):
+        """re-reads the number of experiences, to see the ones added (and flushed) by the writing process"""
+        with open(os.path.join(self.directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        self._num, self._next = meta['num'], meta['next']
+
+    def flush(self):
+        """writes the arrays and then the number of experiences to disk"""
+        if self.read_only or self.states is None:
+            return
+        for name in ARRAY_NAMES:
+            getattr(self, name).flush()
+        meta_path = os.path.join(self.directory, META_FILE)
+        with open(meta_path + '.tmp', 'w') as meta_file:
+            json.dump({'max': self._max, 'num': self._num, 'next': self._next}, meta_file)
+        os.replace(meta_path + '.tmp', meta_path)
+        self._unflushed = 0
+
+    def close(self):
+        self.flush()
+        for name in ARRAY_NAMES:
+            setattr(self, name, None)
+
+    def get_path(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    def reset(self):
+        super().reset()
+        self.flush()
+
+    def add(self, state, action, reward, next_state, legal_actions):
+        if self.read_only:
+            raise PermissionError('the replay was opened read-only')
+        super().add(state, action, reward, next_state, legal_actions)
+        self.count_unflushed(1)
+
+    def add_batch(self, states, actions, rewards, next_states, legal_actions, dones):
+        if self.read_only:
+            raise PermissionError('the replay was opened read-only')
+        super().add_batch(states, actions, rewards, next_states, legal_actions, dones)
+        self.count_unflushed(len(actions))
+
+    def count_unflushed(self, num_added):
+        self._unflushed += num_added
+        if self._unflushed >= self.flush_rate:
+            self.flush()
@@ -0,0 +1,58 @@
+import os
+import json
+import time
+
+# Training telemetry as JSON lines: one JSON object per record (e.g. per episode), appended to the end of the file. The
+# records are buffered and appended flush_rate at a time, so the I/O per record is constant however long the run is,
+# and an interrupted run keeps everything up to the last flush. Plotting is offline, see agent_training/plot_metrics.py.
+
+FLUSH_RATE = 50  # records
+
+
+class MetricsWriter(object):
+
+    def __init__(self, path, flush_rate=FLUSH_RATE):
+        """
+        :param path: the JSON lines file. Records are appended to an existing file, so a resumed run continues it.
+        """
+        self.path = path
+        self.flush_rate = flush_rate
+        self._buffer = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, **record):
+        """adds a record, with the time it was written"""
+        record.setdefault('time', time.time())
+        self._buffer.append(json.dumps(record))
+        if len(self._buffer) >= self.flush_rate:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, 'a') as metrics_file:
+            metrics_file.write('\n'.join(self._buffer) + '\n')
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_metrics(path):
+    """ Returns the records of a metrics file, in order. A line cut by a crash in the middle of a write is skipped """
+    records = []
+    with open(path) as metrics_file:
+        for line in metrics_file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return records
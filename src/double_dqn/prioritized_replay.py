@@ -0,0 +1,97 @@
+import numpy as np
+
+from double_dqn.experience_replay import ExperienceReplay
+
+# Prioritized experience replay (Schaul et al.): an experience is sampled with probability p_i^alpha / sum_k p_k^alpha,
+# where p_i = |TD error| + epsilon is its priority, so the experiences the net predicts worst are replayed more often.
+# The bias this adds to the updates is corrected by importance sampling weights (N * P(i))^-beta, normalized by their
+# maximum, with beta annealed towards 1 during training. New experiences get the maximal priority seen so far, so every
+# experience is replayed at least once before its priority is known.
+
+ALPHA = 0.6
+BETA = 0.4
+BETA_INCREMENT = 1e-5  # per sampled batch
+EPSILON = 1e-3
+
+
+class SumTree(object):
+    """
+    A complete binary tree whose leaves are the priorities of the experiences and every inner node holds the sum of its
+    children, stored in an array: the root is tree[1], the children of node i are 2i and 2i + 1 and the leaf of
+    experience i is tree[size + i]. Updates and sampling are O(log N) and are done for a whole batch at once.
+    """
+
+    def __init__(self, capacity):
+        self.depth = max(0, (capacity - 1).bit_length())
+        self.size = 1 << self.depth  # the capacity, rounded up to a power of 2
+        self.tree = np.zeros(2 * self.size)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[self.size + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        """ Sets the priorities of the given leaves and recomputes their ancestors, level by level """
+        nodes = self.size + np.asarray(indices)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            # sums are recomputed from the children, and not updated by deltas, so the tree never drifts
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """ Returns, for every value in [0, total), the leaf i with sum(leaves before i) <= value < sum(leaves up to i) """
+        values = np.array(values, dtype=float)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.tree[2 * nodes]
+            go_right = values >= left
+            values -= left * go_right
+            nodes = 2 * nodes + go_right
+        return nodes - self.size
+
+    def clear(self):
+        self.tree[:] = 0
+
+
+class PrioritizedExperienceReplay(ExperienceReplay):
+
+    def __init__(self, e_max=10000, alpha=ALPHA, beta=BETA, beta_increment=BETA_INCREMENT, epsilon=EPSILON,
+                 state_dtype=np.float32):
+        super().__init__(e_max, state_dtype)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.tree = SumTree(e_max)
+        self.max_priority = 1.0
+
+    def reset(self):
+        super().reset()
+        self.tree.clear()
+        self.max_priority = 1.0
+
+    def on_add(self, indices):
+        self.tree.update(indices, self.max_priority ** self.alpha)
+
+    def sample(self, batch_size: int):
+        """
+        choose a batch of experiences with probabilities proportional to their priorities. The range of the total
+        priority is split to batch_size equal segments and one experience is sampled from each of them.
+        :return: a tuple (batch, indices, weights), see ExperienceReplay.sample
+        """
+        total = self.tree.total()
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+        indices = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), self.get_num() - 1)
+        probabilities = self.tree.get(indices) / total
+        weights = (self.get_num() * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return self.get_experiences(indices), indices, weights.astype(np.float32)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self.alpha)
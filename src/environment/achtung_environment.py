@@ -1,42 +1,28 @@
 import os
 import sys
 import inspect
-from typing import List
 
 import numpy as np
 import time
+import pygame
 
 current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 
 from static.settings import *
-from src.players.player_factory import PlayerFactory
-from src.environment.state import State
+from src.environment.engine import AchtungEngine
+from src.environment.profiler import TickProfiler
 
 
-class AchtungEnv(object):
-    legal_actions = (0, 1, 2)
-    colors = [PURPLE, BLUE, RED, YELLOW]
+class AchtungEnv(AchtungEngine):
+    """
+    The pygame front-end of the game. This is the only module that imports pygame, so the game rules in
+    AchtungEngine stay headless.
+    """
 
     def __init__(self, training_mode=False):
-        self.training_mode = training_mode
-
-    def reset(self):
-        self.colors = self.initialize_colors()
-        self.head_colors = [HEAD_COLOR for _ in range(len(self.players))]
-        self.draw_status = [True for _ in range(len(self.players))]
-        self.angles = self.initialize_angles()
-        self.positions = self.initialize_positions()
-        self.state = State(ARENA_SHAPE, self.positions, self.angles, self.colors)
-        self.actions = [STRAIGHT for _ in range(len(self.players))]
-        self.draw_counters = self.initialize_draw_counters()
-        self.no_draw_counters = self.initialize_draw_counters()
-        self.draw_limits = self.initialize_draw_limits()
-        self.counter = 0
-        self.update_states()
-        if not self.training_mode:
-            self.update_graphics()
+        AchtungEngine.__init__(self, training_mode)
 
     ### Running the game methods ###
     def play(self):
@@ -44,25 +30,18 @@ class AchtungEnv(object):
             raise Exception('Can not play in training mode. Re-initiate the AchtungEnv object with argument '
                             'training_mode = False')
         players = self.entry()
+        self.close()  # the players of the previous game, if this is a replay
         self.initialize(players)
+        if PROFILE_TICKS:
+            self.profiler = TickProfiler(len(self.players))
         self.intro()
         self.loop()
 
-    def initialize(self, players):
-        self.circles = [CIRCLE_RADIUS_1, CIRCLE_RADIUS_2, CIRCLE_RADIUS_3, CIRCLE_RADIUS_4]
-        self.player_radius = PLAYER_RADIUS
-        self.head_radius = HEAD_RADIUS
-        self.player_speed = PLAYER_SPEED
-        self.d_theta = D_THETA
-        self.no_draw_time = NO_DRAW_TIME
-        self.action_sampling_rate = ACTION_SAMPLING_RATE
-        self.players = self.initialize_players(players)
-        self.reset()
-
     def entry(self):
         min_players_allowed = 1
         pygame.init()
         pygame.font.init()
+        self.font = pygame.font.Font(FONT_PATH, FONT_SIZE)
         self.window = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption(GAME_NAME)
 
@@ -216,6 +195,7 @@ class AchtungEnv(object):
                                       self.angles[i] * 57 - 90)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.close()
                     pygame.quit()
             pygame.display.update()
             pygame.time.wait(ITERATION_LENGTH)
@@ -230,6 +210,7 @@ class AchtungEnv(object):
                 self.draw_arena()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.close()
                     pygame.quit()
             self.counter += 1
             start = time.time()
@@ -243,47 +224,13 @@ class AchtungEnv(object):
                 winner = np.where(self.state.alive)[0][0]
             if self.state.is_terminal_state():
                 self.end(self.counter // self.action_sampling_rate, winner)
+            if self.profiler is None:
+                pygame.display.update()
+                continue
+            start = self.profiler.clock()
             pygame.display.update()
-
-    def tick(self):
-        self.apply_actions()
-        self.update_positions()
-        self.update_lives()
-        self.update_drawing_counters()
-        if not self.training_mode:
-            self.update_graphics()
-        self.update_states()
-
-    def update_actions(self):
-        """ Gets and applies actions for all players still alive"""
-        for i, player in enumerate(self.players):
-            if self.state.alive[i]:
-                self.actions[i] = player.get_action(self.state)
-
-    def apply_actions(self):
-        for i, player in enumerate(self.players):
-            if self.state.alive[i]:
-                self.apply_action(i, self.actions[i])
-
-    ### Player API support methods ###
-    def get_next_state(self, player_ids: List[int], state: State, actions: List[int]) -> State:
-        next_state = State.from_state(state)
-        for _ in range(self.action_sampling_rate):
-            for i, player in enumerate(player_ids):
-                angle = self.calculate_new_angle(state.get_angle(player), actions[i])
-                next_state.set_angle(player, angle)
-                position = self.calculate_new_position(state.get_position(player), angle)
-                next_state.set_position(player, position)
-                next_state.draw_head(self.get_head_position(position, angle))
-                next_state.draw_player(player, True)
-        # TODO: Look into saving in designated memory space by specifying destination of copy.
-        return next_state
-
-    def get_state(self, player_id=0):
-        return self.state
-
-    def get_legal_actions(self, state, player_id):
-        return [RIGHT, LEFT, STRAIGHT]
+            self.profiler.add('display_update', start)
+            self.profiler.end_frame()
 
     ### Drawing related methods ###
     def update_graphics(self):
@@ -305,24 +252,6 @@ class AchtungEnv(object):
                     pygame.draw.circle(self.window, BLACK, self.adjust_pos_to_screen(position),
                                        self.player_radius)
 
-    def update_drawing_counters(self):
-        for i in range(len(self.players)):
-            self.draw_counters[i] += 1
-            if self.draw_counters[i] >= self.draw_limits[i]:
-                self.draw_status[i] = False
-                self.no_draw_counters[i] += 1
-                if self.no_draw_counters[i] > self.no_draw_time:
-                    self.draw_counters[i] = 0
-                    self.no_draw_counters[i] = 0
-                    self.draw_limits[i] = self.initialize_draw_limit()
-                    self.draw_status[i] = True
-
-    def update_states(self):
-        for i in range(len(self.players)):
-            self.state.set_angle(i, self.angles[i])
-            self.state.draw_head(self.get_head_position(self.positions[i], self.angles[i]))
-            self.state.draw_player(i, self.draw_status[i])
-
     def draw_dashboard(self):
         pygame.draw.rect(self.window, WHITE, (0, 0, 150, 720))
         for i, player in enumerate(self.players):
@@ -331,6 +260,9 @@ class AchtungEnv(object):
                 pygame.draw.circle(self.window, self.colors[i], (8, 30 + 30 * i), 5)
             else:
                 pygame.draw.circle(self.window, BLACK, (8, 30 + 30 * i), 5)
+        if self.profiler is not None and PROFILE_OVERLAY:
+            for i, line in enumerate(self.profiler.get_overlay_lines()):
+                self.text_display(line, 5, 30 * (len(self.players) + 1) + 20 * i, (0, 0, 0))
 
     def draw_arena(self):
         if not self.training_mode:
@@ -338,7 +270,7 @@ class AchtungEnv(object):
         self.state.reset_arena()
 
     def text_display(self, text, x, y, color):
-        self.window.blit(FONT.render(text, False, color), (x, y))
+        self.window.blit(self.font.render(text, False, color), (x, y))
 
     @staticmethod
     def rotate_at_center(ds, pos, image, degrees):
@@ -347,64 +279,12 @@ class AchtungEnv(object):
         ds.blit(rotated, (pos[0] - rect.center[0], pos[1] - rect.center[1]))
 
     ### HELP FUNC ###
-    def detect_collision(self, player_id, state, head_pos=0):
-        if head_pos:
-            pos = head_pos
-        else:
-            pos = self.get_head_position(state.get_position(player_id), state.get_angle(player_id))
-        if not self.in_bounds(pos):
-            return True
-        pixel = state.get_3d_pixel((int(round(pos[0])), int(round(pos[1]))))
-        for color in state.colors:
-            if not np.any(pixel - color):
-                return True
-        return False
-
-    def in_bounds(self, pos):
-        return 0 <= int(round(pos[0])) < ARENA_WIDTH and 0 <= int(round(pos[1])) < ARENA_HEIGHT
-
-    def get_head_position(self, position, angle):
-        hx = np.cos(angle) * self.player_radius * 1.5
-        hy = np.sin(angle) * self.player_radius * 1.5
-        return hx + position[0], - hy + position[1]
-
-    def apply_action(self, i, action):
-        self.angles[i] = self.calculate_new_angle(self.angles[i], action)
-
-    def calculate_new_angle(self, previous_angle, action):
-        if action == RIGHT:
-            return previous_angle - self.d_theta
-        if action == LEFT:
-            return previous_angle + self.d_theta
-        return previous_angle  # The chosen action was straight
-
-    def update_positions(self):
-        for i in range(len(self.players)):
-            if self.state.alive[i]:
-                pos = self.calculate_new_position(self.positions[i], self.angles[i])
-                self.positions[i] = pos  # update game positions
-                self.state.set_position(i, pos)  # update state positions
-
-    def update_lives(self):
-        for i in range(len(self.players)):
-            if self.state.alive[i]:
-                if self.detect_collision(i, self.state):
-                    self.state.alive[i] = False
-
-    def calculate_new_position(self, previous_position, angle):
-        dx = np.cos(angle) * self.player_speed
-        dy = np.sin(angle) * self.player_speed
-        return previous_position[0] + dx, previous_position[1] - dy
-
-    def update_pos_angle(self, curr_position, curr_angle, action):
-        new_angle = self.calculate_new_angle(curr_angle, action)
-        new_position = self.calculate_new_position(curr_position, new_angle)
-        return new_position, new_angle
-
     def adjust_pos_to_screen(self, position):
         return int(round(ARENA_X + position[0])), int(round(ARENA_Y + position[1]))
 
     def end(self, lifetime, winner=False):
+        if self.profiler is not None and PROFILE_PATH:
+            self.profiler.dump(PROFILE_PATH)
         self.actions = np.zeros(len(self.players)) + 2
         if not winner is False:
             final_message_1 = f'The winner is player {winner}.'
@@ -431,6 +311,7 @@ class AchtungEnv(object):
         self.window.blit(winner_2, winner_rect_2)
         pygame.display.update()
         pygame.time.wait(2500)
+        self.close()  # restart() does not return: it quits or plays again
         self.restart()
         pygame.quit()
         sys.exit()
@@ -460,6 +341,7 @@ class AchtungEnv(object):
             for ev in pygame.event.get():
                 if ev.type == pygame.QUIT:
                     # deactivates the pygame library
+                    self.close()
                     pygame.quit()
                     quit()
                 # update the play button -
@@ -507,35 +389,3 @@ class AchtungEnv(object):
                     self.window.blit(yes_button, no_rect)
                     self.window.blit(no_button, yes_rect)
                 pygame.display.update()
-
-    def initialize_players(self, players):
-        p = []
-        for i in range(len(players)):
-            p.append(PlayerFactory.create_player(players[i], i, self))
-        return p
-
-    def initialize_angles(self):
-        return np.random.uniform(0, 2 * np.pi, len(self.players))
-
-    def initialize_positions(self):
-        width_margin = ARENA_WIDTH // 5
-        height_margin = ARENA_HEIGHT // 5
-        xx = np.random.uniform(width_margin, ARENA_WIDTH - width_margin, len(self.players))
-        yy = np.random.uniform(height_margin, ARENA_HEIGHT - height_margin, len(self.players))
-        return [(xx[i], yy[i]) for i in range(len(self.players))]
-
-    def initialize_colors(self):
-        return AchtungEnv.colors[:len(self.players)]
-
-    def initialize_draw_counters(self):
-        return [0 for _ in range(len(self.players))]
-
-    def initialize_draw_limits(self):
-        return [self.initialize_draw_limit() for _ in range(len(self.players))]
-
-    def initialize_draw_limit(self):
-        return np.random.randint(50, 150)
-
-    def distance_between_two_pos(self, first_pos, second_pos):
-        dist = np.sqrt((np.abs(first_pos[0] - second_pos[0]) ** 2) + (np.abs(first_pos[1] - second_pos[1]) ** 2))
-        return dist
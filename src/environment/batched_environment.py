@@ -0,0 +1,193 @@
+import numpy as np
+
+from static.settings import *
+from src.environment.sensors import cast_rays, NUM_RAYS, MAX_RAY_DISTANCE
+
+
+class BatchedAchtungEnv(object):
+    """
+    Runs num_envs independent training games side by side. Every game has the same players; player 0 is controlled
+    through step(), all other players are random players (other opponent types raise a ValueError). All games are
+    kept in stacked arrays and are advanced together, so a single call to step() yields one transition per game.
+    The semantics of a single game are the same as TrainingEnv.step.
+    """
+    legal_actions = (0, 1, 2)
+    margin = 6
+
+    def __init__(self, num_envs, players, with_positions=True):
+        for player_type in players[1:]:
+            if player_type != 'r':
+                raise ValueError(f'BatchedAchtungEnv only supports random opponents, got \'{player_type}\'')
+        self.num_envs = num_envs
+        self.num_players = len(players)
+        self.use_positions = with_positions
+        self.player_radius = PLAYER_RADIUS
+        self.head_radius = HEAD_RADIUS
+        self.player_speed = PLAYER_SPEED
+        self.d_theta = D_THETA
+        self.no_draw_time = NO_DRAW_TIME
+        self.action_sampling_rate = ACTION_SAMPLING_RATE
+        self.max_distance = MAX_RAY_DISTANCE
+        self.num_angles = NUM_RAYS
+
+        shape = (num_envs, self.num_players)
+        self.board = np.full((num_envs, ARENA_HEIGHT + 2 * self.margin, ARENA_WIDTH + 2 * self.margin), WHITE_2D,
+                             dtype=np.uint8)
+        self.positions = np.zeros(shape + (2,))
+        self.angles = np.zeros(shape)
+        self.alive = np.zeros(shape, dtype=bool)
+        self.actions = np.full(shape, STRAIGHT)
+        self.draw_status = np.zeros(shape, dtype=bool)
+        self.draw_counters = np.zeros(shape, dtype=int)
+        self.no_draw_counters = np.zeros(shape, dtype=int)
+        self.draw_limits = np.zeros(shape, dtype=int)
+        self._active = np.ones(num_envs, dtype=bool)
+
+        self._turns = np.zeros(len(ACTIONS))
+        self._turns[RIGHT] = -self.d_theta
+        self._turns[LEFT] = self.d_theta
+        self._circles = [np.array(circle) for circle in CIRCLES]
+        self.reset()
+
+    ### Running the games ###
+    def reset(self, indices=None):
+        """ Starts new games at the specified indices (all games if None) and returns their states """
+        if indices is None:
+            indices = np.arange(self.num_envs)
+        indices = np.asarray(indices)
+        n = len(indices)
+        if n == 0:
+            return self.get_states(indices)
+        self.board[indices, self.margin:self.margin + ARENA_HEIGHT, self.margin:self.margin + ARENA_WIDTH] = BLACK_2D
+        self.angles[indices] = np.random.uniform(0, 2 * np.pi, (n, self.num_players))
+        width_margin = ARENA_WIDTH // 5
+        height_margin = ARENA_HEIGHT // 5
+        self.positions[indices, :, 0] = np.random.uniform(width_margin, ARENA_WIDTH - width_margin,
+                                                          (n, self.num_players))
+        self.positions[indices, :, 1] = np.random.uniform(height_margin, ARENA_HEIGHT - height_margin,
+                                                          (n, self.num_players))
+        self.alive[indices] = True
+        self.actions[indices] = STRAIGHT
+        self.draw_status[indices] = True
+        self.draw_counters[indices] = 0
+        self.no_draw_counters[indices] = 0
+        self.draw_limits[indices] = np.random.randint(50, 150, (n, self.num_players))
+        self._active[...] = False
+        self._active[indices] = True
+        self.update_states()
+        self._active[...] = True
+        return self.get_states(indices)
+
+    def step(self, actions, player_id=0):
+        """
+        Applies the specified action of player_id in every game and advances all games by action_sampling_rate ticks.
+        :param actions: an array of num_envs actions.
+        :return: A tuple (next_states, rewards, dones). dones[i] is True iff player_id was already dead in game i, in
+                 which case game i was not advanced, rewards[i] is 0 and next_states[i] is meaningless (this is the
+                 batched counterpart of TrainingEnv.step returning (None, 0)).
+        """
+        dones = np.logical_not(self.alive[:, player_id])
+        self._active = np.logical_not(dones)
+        others = np.random.randint(len(ACTIONS), size=self.actions.shape)
+        update = np.logical_and(self.alive, self._active[:, np.newaxis])
+        self.actions = np.where(update, others, self.actions)
+        self.actions[self._active, player_id] = np.asarray(actions)[self._active]
+        for _ in range(self.action_sampling_rate):
+            self.tick()
+        rewards = self._active.astype(float)
+        next_states = self.get_states(player_id=player_id)
+        self._active[...] = True
+        return next_states, rewards, dones
+
+    def tick(self):
+        self.apply_actions()
+        self.update_positions()
+        self.update_lives()
+        self.update_drawing_counters()
+        self.update_states()
+
+    def get_states(self, indices=None, player_id=0):
+        """ Returns the DRL feature vectors of player_id in the specified games (all games if None) """
+        if indices is None:
+            indices = np.arange(self.num_envs)
+        features = self.get_distance_to_obstacles(indices, player_id)
+        if self.use_positions:
+            return features
+        return features[:, :-2]
+
+    def get_legal_actions(self, states=None):
+        return np.ones((self.num_envs, len(ACTIONS)))
+
+    ### Game mechanics ###
+    def _moving(self):
+        return np.logical_and(self.alive, self._active[:, np.newaxis])
+
+    def apply_actions(self):
+        turns = self._turns[self.actions]
+        self.angles = np.where(self._moving(), self.angles + turns, self.angles)
+
+    def update_positions(self):
+        moving = self._moving()
+        xx = self.positions[..., 0] + np.cos(self.angles) * self.player_speed
+        yy = self.positions[..., 1] - np.sin(self.angles) * self.player_speed
+        self.positions[..., 0] = np.where(moving, xx, self.positions[..., 0])
+        self.positions[..., 1] = np.where(moving, yy, self.positions[..., 1])
+
+    def update_lives(self):
+        moving = self._moving()
+        head = self.get_head_positions()
+        xx = np.round(head[..., 0]).astype(int)
+        yy = np.round(head[..., 1]).astype(int)
+        in_bounds = (0 <= xx) & (xx < ARENA_WIDTH) & (0 <= yy) & (yy < ARENA_HEIGHT)
+        games = np.broadcast_to(np.arange(self.num_envs)[:, np.newaxis], xx.shape)
+        pixels = self.board[games, np.clip(yy, 0, ARENA_HEIGHT - 1) + self.margin,
+                            np.clip(xx, 0, ARENA_WIDTH - 1) + self.margin]
+        # trails are drawn with player_id + 2, heads and empty pixels are below that
+        collided = np.logical_or(np.logical_not(in_bounds), pixels >= 2)
+        self.alive[np.logical_and(moving, collided)] = False
+
+    def update_drawing_counters(self):
+        active = self._active[:, np.newaxis]
+        self.draw_counters += active
+        stopped = np.logical_and(active, self.draw_counters >= self.draw_limits)
+        self.draw_status[stopped] = False
+        self.no_draw_counters += stopped
+        restart = np.logical_and(stopped, self.no_draw_counters > self.no_draw_time)
+        n_restart = np.count_nonzero(restart)
+        if n_restart:
+            self.draw_counters[restart] = 0
+            self.no_draw_counters[restart] = 0
+            self.draw_limits[restart] = np.random.randint(50, 150, n_restart)
+            self.draw_status[restart] = True
+
+    def update_states(self):
+        games = np.flatnonzero(self._active)
+        head = self.get_head_positions()
+        for i in range(self.num_players):
+            self.draw_circles(games, head[games, i], np.full(len(games), HEAD_2D), self.head_radius)
+            colors = np.where(self.draw_status[games, i], i + 2, BLACK_2D)
+            self.draw_circles(games, self.positions[games, i], colors, self.player_radius)
+
+    def draw_circles(self, games, centers, colors, radius):
+        """ Draws a circle of the specified radius in each of the specified games """
+        circles = self._circles[radius - 1][np.newaxis, ...] + centers[:, np.newaxis, :]
+        circles = np.round(circles).astype(int)
+        circles[circles < 0] = 0
+        xx, yy = circles[..., 0], circles[..., 1]
+        xx[xx >= ARENA_WIDTH] = ARENA_WIDTH - 10
+        yy[yy >= ARENA_HEIGHT] = ARENA_HEIGHT - 10
+        self.board[games[:, np.newaxis], yy + self.margin, xx + self.margin] = colors[:, np.newaxis]
+
+    def get_head_positions(self):
+        hx = np.cos(self.angles) * self.player_radius * 1.5
+        hy = np.sin(self.angles) * self.player_radius * 1.5
+        return np.stack([hx + self.positions[..., 0], - hy + self.positions[..., 1]], axis=-1)
+
+    def get_distance_to_obstacles(self, indices, player_id):
+        """ Casts num_angles rays from the position of player_id in each of the specified games, and returns the
+        normalized distance to the first obstacle on each ray """
+        indices = np.asarray(indices)
+        distances = cast_rays(self.board, self.positions[indices, player_id, np.newaxis],
+                              self.angles[indices, player_id, np.newaxis], self.num_angles, self.max_distance,
+                              self.margin, board_ids=indices)
+        return distances[:, 0] / self.max_distance
@@ -0,0 +1,103 @@
+import copy
+from functools import lru_cache
+
+import numpy as np
+
+# A coarse distance transform of the owner grid, used to skip empty space when walking along a ray. The board is split
+# into BLOCK x BLOCK pixel blocks, and every block holds the Chebyshev distance (in blocks, capped at CAP) to the nearest
+# block that contains a non empty pixel. Every pixel within (d - 1) * BLOCK pixels of a block with value d is therefore
+# empty. The field is only ever lowered around newly drawn circles, so erasing a trail (drawing gaps) leaves it
+# conservative - never larger than the real distance.
+
+BLOCK = 4
+CAP = 16
+
+
+@lru_cache(maxsize=None)
+def _initial_field(board_shape, margin, block, cap):
+    """ Returns the field of an empty arena, where only the blocks that overlap the margin are occupied """
+    def axis_distances(size):
+        n_blocks = -(-size // block)
+        starts = np.arange(n_blocks) * block
+        occupied = np.flatnonzero(np.logical_or(starts < margin, starts + block > size - margin))
+        return np.min(np.abs(np.arange(n_blocks)[:, np.newaxis] - occupied), axis=1)
+
+    field = np.minimum.outer(axis_distances(board_shape[0]), axis_distances(board_shape[1]))
+    field = np.minimum(field, cap).astype(np.uint8)
+    field.flags.writeable = False
+    return field
+
+
+class DistanceField(object):
+
+    def __init__(self, board_shape, margin, block=BLOCK, cap=CAP):
+        self.board_shape = tuple(board_shape)
+        self.margin = margin
+        self.block = block
+        self.cap = cap
+        self.values = _initial_field(self.board_shape, margin, block, cap).copy()
+
+    def reset(self):
+        self.values[...] = _initial_field(self.board_shape, self.margin, self.block, self.cap)
+
+    def copy(self):
+        new_field = copy.copy(self)
+        new_field.values = self.values.copy()
+        return new_field
+
+    def safe_radius(self, row, col):
+        """ Returns r such that every pixel within Chebyshev distance r of (row, col) is empty (negative if its block is occupied) """
+        return (self.values.item(row // self.block, col // self.block) - 1) * self.block
+
+    def mark(self, rows, cols, record=False):
+        """
+        Lowers the field around pixels that were just drawn.
+        :param rows: the rows of the drawn pixels (board coordinates).
+        :param cols: the columns of the drawn pixels.
+        :param record: if True, returns (window, previous values) so the update can be undone.
+        """
+        return self.mark_box(rows.min(), rows.max(), cols.min(), cols.max(), record)
+
+    def mark_box(self, top, bottom, left, right, record=False):
+        """ Like mark, for drawn pixels whose box is rows top to bottom and columns left to right (inclusive) """
+        top, bottom = top // self.block, bottom // self.block
+        left, right = left // self.block, right // self.block
+        height, width = self.values.shape
+        row_slice = slice(max(top - self.cap, 0), min(bottom + self.cap + 1, height))
+        col_slice = slice(max(left - self.cap, 0), min(right + self.cap + 1, width))
+        window = self.values[row_slice, col_slice]
+        previous = window.copy() if record else None
+        row_distances = _distances_to_range(row_slice, top, bottom)
+        col_distances = _distances_to_range(col_slice, left, right)
+        np.minimum(window, np.maximum.outer(row_distances, col_distances), out=window)
+        return (row_slice, col_slice), previous
+
+    def mark_boxes(self, boxes, record=False):
+        """
+        Lowers the field around several drawn circles at once, exactly as one call of mark per circle would (the field
+        is lowered to the minimum over the circles, so their order does not matter).
+        :param boxes: an integer array of (top row, bottom row, left column, right column) of every circle's pixels.
+        :param record: if True, returns (window, previous values) so the update can be undone.
+        """
+        if len(boxes) == 0:
+            return None, None
+        tops, bottoms, lefts, rights = (boxes // self.block).T
+        height, width = self.values.shape
+        row_slice = slice(max(tops.min() - self.cap, 0), min(bottoms.max() + self.cap + 1, height))
+        col_slice = slice(max(lefts.min() - self.cap, 0), min(rights.max() + self.cap + 1, width))
+        rows = np.arange(row_slice.start, row_slice.stop)
+        cols = np.arange(col_slice.start, col_slice.stop)
+        row_distances = np.maximum(np.maximum(tops[:, np.newaxis] - rows, rows - bottoms[:, np.newaxis]), 0)
+        col_distances = np.maximum(np.maximum(lefts[:, np.newaxis] - cols, cols - rights[:, np.newaxis]), 0)
+        distances = np.maximum(row_distances[:, :, np.newaxis], col_distances[:, np.newaxis, :]).min(axis=0)
+        window = self.values[row_slice, col_slice]
+        previous = window.copy() if record else None
+        np.minimum(window, np.minimum(distances, self.cap).astype(np.uint8), out=window)
+        return (row_slice, col_slice), previous
+
+
+def _distances_to_range(window, first, last):
+    """ Returns the distance of every index of window (a slice) to the closed range [first, last] """
+    indices = np.arange(window.start, window.stop)
+    return np.maximum(np.maximum(first - indices, indices - last), 0).astype(np.uint8)
+
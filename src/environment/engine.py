@@ -0,0 +1,319 @@
+import os
+import sys
+import inspect
+from typing import List
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+from static.settings import *
+from src.players.player_factory import PlayerFactory
+from src.environment.state import State
+from src.environment.heading_lattice import HeadingLattice
+
+
+class AchtungEngine(object):
+    """
+    The rules of the game - movement, collisions, drawing gaps and terminal detection - without any rendering.
+    This module must not import pygame, so training and search code can run it headless. The pygame front-end is
+    AchtungEnv, which extends this class.
+    """
+    legal_actions = (0, 1, 2)
+    colors = [PURPLE, BLUE, RED, YELLOW]
+    profiler = None  # a TickProfiler, see profiler.py
+    heading_lattice = None  # a HeadingLattice if HEADING_LATTICE, see heading_lattice.py
+
+    def __init__(self, training_mode=True):
+        self.training_mode = training_mode
+
+    def reset(self):
+        self.colors = self.initialize_colors()
+        self.head_colors = [HEAD_COLOR for _ in range(len(self.players))]
+        self.draw_status = [True for _ in range(len(self.players))]
+        self.angles = self.initialize_angles()
+        self.positions = self.initialize_positions()
+        self.state = State(ARENA_SHAPE, self.positions, self.angles, self.colors)
+        self.actions = [STRAIGHT for _ in range(len(self.players))]
+        self.draw_counters = self.initialize_draw_counters()
+        self.no_draw_counters = self.initialize_draw_counters()
+        self.draw_limits = self.initialize_draw_limits()
+        self.counter = 0
+        self.update_states()
+        if not self.training_mode:
+            self.update_graphics()
+
+    def initialize(self, players):
+        self.circles = [CIRCLE_RADIUS_1, CIRCLE_RADIUS_2, CIRCLE_RADIUS_3, CIRCLE_RADIUS_4]
+        self.player_radius = PLAYER_RADIUS
+        self.head_radius = HEAD_RADIUS
+        self.player_speed = PLAYER_SPEED
+        self.d_theta = D_THETA
+        self.no_draw_time = NO_DRAW_TIME
+        self.action_sampling_rate = ACTION_SAMPLING_RATE
+        if HEADING_LATTICE:
+            self.heading_lattice = HeadingLattice(self.player_speed, self.player_radius * 1.5)
+            self.d_theta = self.heading_lattice.step
+        self.players = self.initialize_players(players)
+        self.reset()
+
+    ### Running the game methods ###
+    def tick(self):
+        if self.profiler is not None:
+            return self.profiled_tick()
+        self.apply_actions()
+        self.update_positions()
+        self.update_lives()
+        self.update_drawing_counters()
+        if not self.training_mode:
+            self.update_graphics()
+        self.update_states()
+
+    def profiled_tick(self):
+        """ tick(), with the time of every phase and the counters recorded in the current frame of the profiler """
+        profiler = self.profiler
+        start = profiler.clock()
+        self.apply_actions()
+        profiler.add('apply_actions', start)
+        start = profiler.clock()
+        self.update_positions()
+        profiler.add('update_positions', start)
+        profiler.count('collisions_checked', int(np.sum(self.state.alive)))
+        start = profiler.clock()
+        self.update_lives()
+        profiler.add('update_lives', start)
+        start = profiler.clock()
+        self.update_drawing_counters()
+        profiler.add('update_drawing_counters', start)
+        if not self.training_mode:
+            start = profiler.clock()
+            self.update_graphics()
+            profiler.add('update_graphics', start)
+        start = profiler.clock()
+        self.update_states()
+        profiler.add('update_states', start)
+        profiler.count('circles_stamped', 2 * len(self.players))
+
+    def advance(self, num_ticks):
+        """
+        Runs num_ticks ticks. The result is bit for bit the same as calling tick() num_ticks times, but the distance
+        field is only lowered once, after the last tick, for all the circles drawn during the ticks (nothing reads it
+        in between: collisions are detected on the board itself).
+        """
+        if not self.training_mode or self.state.is_recording() or self.profiler is not None:
+            for _ in range(num_ticks):
+                self.tick()
+            return
+        for _ in range(num_ticks):
+            self.apply_actions()
+            self.update_positions()
+            self.update_lives()
+            self.update_drawing_counters()
+            self.update_states(defer_marks=True)
+        self.state.apply_pending_marks()
+
+    def close(self):
+        """ Releases what the players hold outside of the process (the worker pools of parallel alpha-beta searches) """
+        for player in getattr(self, 'players', []):  # none before the first initialize
+            if hasattr(player, 'close'):
+                player.close()
+
+    def update_actions(self):
+        """ Gets and applies actions for all players still alive"""
+        alive = [i for i in range(len(self.players)) if self.state.alive[i]]
+        if self.profiler is not None:
+            start = self.profiler.clock()
+            for i, action in zip(alive, self.profiled_get_actions(alive)):
+                self.actions[i] = action
+            self.profiler.add('update_actions', start)
+            return
+        for i, action in zip(alive, self.get_actions(alive)):
+            self.actions[i] = action
+
+    def get_actions(self, player_ids):
+        """
+        Returns the actions of the given players in the current state. Players of the same policy (see
+        Player.get_policy), e.g. DRL players of the same model, choose together, so every distinct model computes the
+        features and runs the forward pass once per tick for all of its players.
+        """
+        actions = {}
+        policies = {}
+        for i in player_ids:
+            policy = self.players[i].get_policy()
+            if policy is None:
+                actions[i] = self.players[i].get_action(self.state)
+            else:
+                policies.setdefault(policy, []).append(i)
+        for ids in policies.values():
+            players = [self.players[i] for i in ids]
+            actions.update(zip(ids, players[0].get_actions(players, self.state)))
+        return [actions[i] for i in player_ids]
+
+    def profiled_get_actions(self, player_ids):
+        """
+        get_actions(), with the time of every player's action recorded in the profiler. The time of a batch of players
+        of the same policy is split evenly among them.
+        """
+        profiler = self.profiler
+        actions = {}
+        policies = {}
+        for i in player_ids:
+            policy = self.players[i].get_policy()
+            if policy is None:
+                start = profiler.clock()
+                actions[i] = self.players[i].get_action(self.state)
+                profiler.add(f'action_{i}', start)
+            else:
+                policies.setdefault(policy, []).append(i)
+        for ids in policies.values():
+            players = [self.players[i] for i in ids]
+            start = profiler.clock()
+            actions.update(zip(ids, players[0].get_actions(players, self.state)))
+            elapsed = profiler.clock() - start
+            for i in ids:
+                profiler.add_elapsed(f'action_{i}', elapsed / len(ids))
+            profiler.count('feature_vectors', len(ids))
+        return [actions[i] for i in player_ids]
+
+    def apply_actions(self):
+        for i, player in enumerate(self.players):
+            if self.state.alive[i]:
+                self.apply_action(i, self.actions[i])
+
+    def update_graphics(self):
+        """ The engine has nothing to draw. Overridden by the pygame front-end """
+        pass
+
+    ### Player API support methods ###
+    def get_next_state(self, player_ids: List[int], state: State, actions: List[int]) -> State:
+        next_state = State.from_state(state)
+        for _ in range(self.action_sampling_rate):
+            for i, player in enumerate(player_ids):
+                angle = self.calculate_new_angle(state.get_angle(player), actions[i])
+                next_state.set_angle(player, angle)
+                position = self.calculate_new_position(state.get_position(player), angle)
+                next_state.set_position(player, position)
+                next_state.draw_head(self.get_head_position(position, angle))
+                next_state.draw_player(player, True)
+        # TODO: Look into saving in designated memory space by specifying destination of copy.
+        return next_state
+
+    def get_state(self, player_id=0):
+        return self.state
+
+    def get_legal_actions(self, state, player_id):
+        return [RIGHT, LEFT, STRAIGHT]
+
+    ### State updating methods ###
+    def update_drawing_counters(self):
+        for i in range(len(self.players)):
+            self.draw_counters[i] += 1
+            if self.draw_counters[i] >= self.draw_limits[i]:
+                self.draw_status[i] = False
+                self.no_draw_counters[i] += 1
+                if self.no_draw_counters[i] > self.no_draw_time:
+                    self.draw_counters[i] = 0
+                    self.no_draw_counters[i] = 0
+                    self.draw_limits[i] = self.initialize_draw_limit()
+                    self.draw_status[i] = True
+
+    def update_states(self, defer_marks=False):
+        for i in range(len(self.players)):
+            self.state.set_angle(i, self.angles[i])
+        heads = [self.get_head_position(self.positions[i], self.angles[i]) for i in range(len(self.players))]
+        colors = [i + 2 if self.draw_status[i] else BLACK_2D for i in range(len(self.players))]
+        self.state.draw_players(heads, colors, defer_marks)
+
+    ### HELP FUNC ###
+    def detect_collision(self, player_id, state, head_pos=0):
+        if head_pos:
+            pos = head_pos
+        else:
+            pos = self.get_head_position(state.get_position(player_id), state.get_angle(player_id))
+        if not self.in_bounds(pos):
+            return True
+        return state.is_player_pixel(pos)
+
+    def in_bounds(self, pos):
+        return 0 <= int(round(pos[0])) < ARENA_WIDTH and 0 <= int(round(pos[1])) < ARENA_HEIGHT
+
+    def get_head_position(self, position, angle):
+        if self.heading_lattice is not None:
+            return self.heading_lattice.head(position, angle)
+        hx = np.cos(angle) * self.player_radius * 1.5
+        hy = np.sin(angle) * self.player_radius * 1.5
+        return hx + position[0], - hy + position[1]
+
+    def apply_action(self, i, action):
+        self.angles[i] = self.calculate_new_angle(self.angles[i], action)
+
+    def calculate_new_angle(self, previous_angle, action):
+        if self.heading_lattice is not None:
+            return self.heading_lattice.turn(previous_angle, action)
+        if action == RIGHT:
+            return previous_angle - self.d_theta
+        if action == LEFT:
+            return previous_angle + self.d_theta
+        return previous_angle  # The chosen action was straight
+
+    def update_positions(self):
+        for i in range(len(self.players)):
+            if self.state.alive[i]:
+                pos = self.calculate_new_position(self.positions[i], self.angles[i])
+                self.positions[i] = pos  # update game positions
+                self.state.set_position(i, pos)  # update state positions
+
+    def update_lives(self):
+        for i in range(len(self.players)):
+            if self.state.alive[i]:
+                if self.detect_collision(i, self.state):
+                    self.state.alive[i] = False
+
+    def calculate_new_position(self, previous_position, angle):
+        if self.heading_lattice is not None:
+            return self.heading_lattice.move(previous_position, angle)
+        dx = np.cos(angle) * self.player_speed
+        dy = np.sin(angle) * self.player_speed
+        return previous_position[0] + dx, previous_position[1] - dy
+
+    def update_pos_angle(self, curr_position, curr_angle, action):
+        new_angle = self.calculate_new_angle(curr_angle, action)
+        new_position = self.calculate_new_position(curr_position, new_angle)
+        return new_position, new_angle
+
+    def initialize_players(self, players):
+        p = []
+        for i in range(len(players)):
+            p.append(PlayerFactory.create_player(players[i], i, self))
+        return p
+
+    def initialize_angles(self):
+        angles = np.random.uniform(0, 2 * np.pi, len(self.players))
+        if self.heading_lattice is not None:
+            return self.heading_lattice.quantize(angles)
+        return angles
+
+    def initialize_positions(self):
+        width_margin = ARENA_WIDTH // 5
+        height_margin = ARENA_HEIGHT // 5
+        xx = np.random.uniform(width_margin, ARENA_WIDTH - width_margin, len(self.players))
+        yy = np.random.uniform(height_margin, ARENA_HEIGHT - height_margin, len(self.players))
+        return [(xx[i], yy[i]) for i in range(len(self.players))]
+
+    def initialize_colors(self):
+        return AchtungEngine.colors[:len(self.players)]
+
+    def initialize_draw_counters(self):
+        return [0 for _ in range(len(self.players))]
+
+    def initialize_draw_limits(self):
+        return [self.initialize_draw_limit() for _ in range(len(self.players))]
+
+    def initialize_draw_limit(self):
+        return np.random.randint(50, 150)
+
+    def distance_between_two_pos(self, first_pos, second_pos):
+        dist = np.sqrt((np.abs(first_pos[0] - second_pos[0]) ** 2) + (np.abs(first_pos[1] - second_pos[1]) ** 2))
+        return dist
@@ -0,0 +1,106 @@
+import json
+import time
+
+import numpy as np
+
+from static.settings import *
+
+# Per-phase timing of the game loop. The engine times every phase of a tick (and the front-end the graphics and the
+# display update) into the current frame of a TickProfiler, with per-player timings of get_action and a few counters,
+# and the frames go into a ring buffer of the last capacity frames, from which the histograms and percentiles are
+# computed on demand. Profiling is off unless a profiler is set on the engine: the only cost of the instrumentation is
+# then one attribute check per tick, since the timed code is a separate path (AchtungEngine.profiled_tick).
+
+CAPACITY = 4096  # frames
+ENGINE_PHASES = ['update_actions', 'apply_actions', 'update_positions', 'update_lives', 'update_drawing_counters',
+                 'update_graphics', 'update_states', 'display_update']
+COUNTERS = ['collisions_checked', 'circles_stamped', 'feature_vectors']
+HISTOGRAM_BINS = np.array([0, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, ITERATION_LENGTH, np.inf])  # ms
+OVERLAY_FRAMES = 60  # the overlay shows the means of the last frames
+
+
+class TickProfiler(object):
+
+    def __init__(self, num_players, capacity=CAPACITY):
+        """
+        :param num_players: the number of players, whose get_action is timed separately (phases action_<i>).
+        """
+        self.phases = ENGINE_PHASES + [f'action_{i}' for i in range(num_players)]
+        self.phase_index = {phase: i for i, phase in enumerate(self.phases)}
+        self.counter_index = {counter: i for i, counter in enumerate(COUNTERS)}
+        self.capacity = capacity
+        self.times = np.zeros((capacity, len(self.phases)))  # ms
+        self.counts = np.zeros((capacity, len(COUNTERS)), dtype=np.int64)
+        self.num_frames = 0
+        self._frame_times = np.zeros(len(self.phases))
+        self._frame_counts = np.zeros(len(COUNTERS), dtype=np.int64)
+
+    @staticmethod
+    def clock():
+        return time.perf_counter()
+
+    def add(self, phase, start):
+        """ adds the time since start (a clock() value) to a phase of the current frame """
+        self._frame_times[self.phase_index[phase]] += (time.perf_counter() - start) * 1000
+
+    def add_elapsed(self, phase, seconds):
+        self._frame_times[self.phase_index[phase]] += seconds * 1000
+
+    def count(self, counter, amount=1):
+        self._frame_counts[self.counter_index[counter]] += amount
+
+    def end_frame(self):
+        """ moves the current frame into the ring buffer and starts a new one """
+        row = self.num_frames % self.capacity
+        self.times[row] = self._frame_times
+        self.counts[row] = self._frame_counts
+        self._frame_times[:] = 0
+        self._frame_counts[:] = 0
+        self.num_frames += 1
+
+    def get_frames(self, last=None):
+        """ Returns the times (ms, frames x phases) and counts (frames x counters) of the last frames, oldest first """
+        num = min(self.num_frames, self.capacity)
+        order = (np.arange(num) + self.num_frames - num) % self.capacity
+        if last is not None:
+            order = order[len(order) - min(last, num):]
+        return self.times[order], self.counts[order]
+
+    def get_histograms(self, bins=HISTOGRAM_BINS):
+        """ Returns a dict from a phase to the number of frames in every bin of its time (ms) """
+        times, _ = self.get_frames()
+        return {phase: np.histogram(times[:, i], bins)[0].tolist() for i, phase in enumerate(self.phases)}
+
+    def summary(self):
+        """
+        Returns the statistics of the buffered frames: the mean, p50, p99 and max time of every phase and of the whole
+        frame (ms), the number of frames over ITERATION_LENGTH and the mean of every counter per frame.
+        """
+        times, counts = self.get_frames()
+        if not len(times):
+            return {}
+        totals = times[:, :len(ENGINE_PHASES)].sum(axis=1)  # the actions are part of update_actions
+        phases = {phase: times[:, i] for i, phase in enumerate(self.phases)}
+        phases['frame'] = totals
+        return {'frames': len(times), 'missed_frames': int(np.sum(totals > ITERATION_LENGTH)),
+                'phases': {phase: {'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+                                   'p99': float(np.percentile(values, 99)), 'max': float(values.max())}
+                           for phase, values in phases.items()},
+                'counters': {counter: float(counts[:, i].mean()) for i, counter in enumerate(COUNTERS)}}
+
+    def get_overlay_lines(self, last=OVERLAY_FRAMES):
+        """ Returns short text lines of the mean time of every phase in the last frames, for the dashboard """
+        times, _ = self.get_frames(last)
+        if not len(times):
+            return []
+        means = times.mean(axis=0)
+        lines = [f'frame {times[:, :len(ENGINE_PHASES)].sum(axis=1).mean():.2f}ms']
+        return lines + [f'{phase[:12]} {mean:.2f}' for phase, mean in zip(self.phases, means)]
+
+    def dump(self, path):
+        """ writes the summary, the histograms and the buffered frames to a JSON file """
+        times, counts = self.get_frames()
+        with open(path, 'w') as dump_file:
+            json.dump({'phases': self.phases, 'counters': COUNTERS, 'histogram_bins': HISTOGRAM_BINS.tolist()[:-1],
+                       'summary': self.summary(), 'histograms': self.get_histograms(),
+                       'times': np.round(times, 4).tolist(), 'counts': counts.tolist()}, dump_file)
@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+import numpy as np
+
+# Ray casting sensors for the DRL features. A ray is sampled at every integer distance in [MIN_RAY_DISTANCE,
+# max_distance) and hits the first sample that falls on a non empty pixel of the owner grid (a trail, a head or the
+# margin). All rays of all players (and of many boards) are sampled as (players x rays x samples) tensors, each resolved
+# with a single gather against the flattened boards.
+
+MIN_RAY_DISTANCE = 10
+NUM_RAYS = 25
+MAX_RAY_DISTANCE = 350
+RAY_CHUNK_SIZE = 2 ** 15  # samples per chunk when casting rays for many players
+
+
+@lru_cache(maxsize=None)
+def get_ray_angles(num_angles):
+    """ Returns the angles of num_angles rays spread evenly over the half plane in front of a player """
+    return np.array([(-np.pi / 2) + ((i / (num_angles - 1)) * np.pi) for i in range(num_angles)])
+
+
+def cast_rays(boards, positions, angles, num_angles, max_distance, margin, board_ids=None):
+    """
+    Casts num_angles rays from each of the given players, on each of the given boards.
+    :param boards: a contiguous array of owner grids (B, height + 2 * margin, width + 2 * margin). Every non zero pixel
+           blocks a ray, including the margin.
+    :param positions: an array (N, P, 2) of player positions in arena coordinates.
+    :param angles: an array (N, P) of player angles.
+    :param board_ids: the board of each of the N rows of positions. Defaults to one row per board.
+    :return: an array (N, P, num_angles) with the distance to the first obstacle on every ray, or max_distance if the
+             ray hits nothing.
+    """
+    _, height, width = boards.shape
+    positions = np.asarray(positions, dtype=float)
+    angles = np.asarray(angles, dtype=float)
+    if board_ids is None:
+        board_ids = np.arange(len(boards))
+    # every (board, player) pair is an independent row of rays
+    board_ids = np.repeat(np.asarray(board_ids), angles.shape[-1])
+    flat_positions = positions.reshape(-1, 2)
+    flat_angles = angles.reshape(-1)
+    distances = np.empty((len(flat_angles), num_angles))
+    # Many players are cast in chunks so the (players x rays x samples) intermediates stay in cache
+    chunk = max(1, RAY_CHUNK_SIZE // (num_angles * (max_distance - MIN_RAY_DISTANCE)))
+    for start in range(0, len(flat_angles), chunk):
+        rows = slice(start, start + chunk)
+        distances[rows] = _cast_rays(boards.reshape(-1), height, width, flat_positions[rows], flat_angles[rows],
+                                     num_angles, max_distance, margin, board_ids[rows])
+    return distances.reshape(angles.shape + (num_angles,))
+
+
+def _cast_rays(flat_boards, height, width, positions, angles, num_angles, max_distance, margin, board_ids):
+    """ Casts the rays of a chunk of players. positions is (N, 2), angles and board_ids are (N,) """
+    samples = np.arange(MIN_RAY_DISTANCE, max_distance, dtype=float)
+    angles = angles[:, np.newaxis] + get_ray_angles(num_angles)
+    px = positions[:, 0, np.newaxis, np.newaxis] + margin
+    py = positions[:, 1, np.newaxis, np.newaxis] + margin
+    xx = _sample_axis(px, np.cos(angles), samples, margin - 1, width - 1)
+    yy = _sample_axis(py, -np.sin(angles), samples, margin - 1, height - 1)
+
+    # flatten (board, y, x) into a single index and gather all samples at once
+    flat = yy * width
+    flat += xx
+    flat += (board_ids * (height * width))[:, np.newaxis, np.newaxis]
+    hits = flat_boards[flat] != 0
+
+    # index of the first hit of every ray in the flattened samples
+    first = np.argmax(hits, axis=-1) + np.arange(angles.size).reshape(angles.shape) * len(samples)
+    dx = px[..., 0] - xx.reshape(-1)[first]
+    dy = py[..., 0] - yy.reshape(-1)[first]
+    return np.where(hits.reshape(-1)[first], np.sqrt(dx ** 2 + dy ** 2), max_distance)
+
+
+def _sample_axis(start, direction, samples, low, high):
+    """ Returns the rounded and clipped coordinates start + direction * samples along one axis """
+    coords = direction[..., np.newaxis] * samples
+    coords += start
+    np.rint(coords, out=coords)
+    np.maximum(coords, low, out=coords)
+    np.minimum(coords, high, out=coords)
+    return coords.astype(np.intp)
@@ -1,7 +1,39 @@
+import math
 import numpy as np
 import abc
 from static.settings import *
+from src.environment.sensors import cast_rays, NUM_RAYS, MAX_RAY_DISTANCE, MIN_RAY_DISTANCE
+from src.environment.distance_field import DistanceField
 import copy
+from functools import lru_cache
+
+ZOBRIST_SEED = 2021
+HEAD_CIRCLE = np.array(CIRCLES[HEAD_RADIUS - 1])
+PLAYER_CIRCLE = np.array(CIRCLES[PLAYER_RADIUS - 1])
+# Consecutive stamps of a trail further apart than this are joined by extra stamps, so fast players leave no gaps
+TRAIL_SPACING = PLAYER_RADIUS
+
+
+def _make_stamp(circle):
+    """
+    Returns the stamp of a circle of CIRCLES: its (x, y) pixel offsets as floats, and the same pixels as a boolean
+    mask over their bounding box, with the offset (x, y) of the box's top left corner.
+    """
+    offsets = np.array(circle)
+    left, top = offsets.min(axis=0)
+    mask = np.zeros(offsets.max(axis=0)[::-1] - (top, left) + 1, dtype=bool)
+    mask[offsets[:, 1] - top, offsets[:, 0] - left] = True
+    return offsets.astype(float), mask, int(left), int(top)
+
+
+STAMPS = [_make_stamp(circle) for circle in CIRCLES]  # by radius - 1
+
+
+@lru_cache(maxsize=None)
+def get_zobrist_keys(board_shape):
+    """ Returns a random uint64 key per pixel of a board. The keys are the same in every process """
+    rng = np.random.default_rng(ZOBRIST_SEED)
+    return rng.integers(0, 2 ** 63, size=board_shape[0] * board_shape[1], dtype=np.uint64)
 
 
 class State:
@@ -9,42 +41,78 @@ class State:
 
     def __init__(self, shape, positions, angles, colors):
         self.margin = 6
-        # shape = shape[0] + (self.margin * 2), shape[1] + (self.margin * 2), shape[2]
-        # self._rgb_board[:self.margin - 8, :, ...] = BLACK
-        # self._rgb_board[ARENA_HEIGHT + self.margin + 8:, :, ...] = BLACK
-        # self._rgb_board[:, :self.margin - 8, ...] = BLACK
-        # self._rgb_board[:, ARENA_WIDTH + self.margin + 8:, ...] = BLACK
-
-        shape_3d = shape[0] + (self.margin * 2), shape[1] + (self.margin * 2), shape[2]
-        shape_2d = (shape[0], shape[1])
-        self._rgb_board = np.ones(shape_3d) * WHITE
-        self._board = np.ones(shape_2d) * WHITE_2D
+        # A single uint8 grid holds the owner of every pixel: BLACK_2D for empty pixels, HEAD_2D for heads and
+        # player_id + 2 for trails. The margin around the arena is filled with WHITE_2D, so rays that leave the arena
+        # hit it without any bounds checks. RGB is only produced on demand by get_rgb_board.
+        board_shape = shape[0] + (self.margin * 2), shape[1] + (self.margin * 2)
+        self._board = np.full(board_shape, WHITE_2D, dtype=np.uint8)
+        self._distance_field = DistanceField(board_shape, self.margin)
+        self._board_hash = None  # maintained only once enable_hashing is called
         self.reset_arena()
         self.colors = colors
         self._positions = positions
         self.alive = [True for _ in range(len(positions))]
         self._angles = angles
         self.counts = [0 for _ in angles]
-
-    def get_3d_pixel(self, coord):
-        return self._rgb_board[self.margin + int(round(coord[1])), self.margin + int(round(coord[0])), ...]
+        self._checkpoints = []
+        self._pending_marks = []  # circles drawn by draw_players whose distance field update was deferred
 
     def get_2d_pixel(self, coord):
-        return self._board[int(round(coord[1])), int(round(coord[0]))]
+        return self._board[self.margin + int(round(coord[1])), self.margin + int(round(coord[0]))]
 
-    def _get_rgb_board(self):
-        return self._rgb_board
+    def get_rgb_board(self):
+        """ Returns an RGB image of the board (margin included), built from the owner grid """
+        palette = np.array([BLACK, HEAD_COLOR] + list(self.colors), dtype=np.uint8)
+        rgb_board = palette[np.minimum(self._board, len(palette) - 1)]
+        rgb_board[:self.margin, ...] = WHITE
+        rgb_board[-self.margin:, ...] = WHITE
+        rgb_board[:, :self.margin, ...] = WHITE
+        rgb_board[:, -self.margin:, ...] = WHITE
+        return rgb_board
 
     def get_board(self):
-        return self._board
+        return self._board[self.margin:-self.margin, self.margin:-self.margin]
+
+    def get_distance_field(self):
+        return self._distance_field
+
+    def enable_hashing(self):
+        """
+        Starts maintaining a Zobrist hash of the board: the xor of key(pixel) * value(pixel) over all pixels, updated
+        incrementally by draw_circle.
+        """
+        if self._board_hash is None:
+            self._board_hash = self.calc_board_hash()
+
+    def get_board_hash(self):
+        return self._board_hash
+
+    def calc_board_hash(self):
+        keys = get_zobrist_keys(self._board.shape)
+        return int(np.bitwise_xor.reduce(keys * self._board.ravel()))
 
     def is_2d_pos_available(self, coord):
         pixel = self.get_2d_pixel(coord)
         return pixel == 0
 
-    # def set_board(self, board: np.ndarray):
-    #     arena = self.get_rgb_board()
-    #     arena[...] = board.copy()
+    def is_player_pixel(self, coord):
+        """ Returns True iff the pixel is part of a trail. Heads and the margin are HEAD_2D / WHITE_2D, below every
+        trail value """
+        return self.get_2d_pixel(coord) > HEAD_2D
+
+    def get_full_board(self):
+        """ Returns the owner grid including the margin (not a copy) """
+        return self._board
+
+    def set_board(self, board: np.ndarray, distance_field: np.ndarray, board_hash=None):
+        """
+        Copies an owner grid (margin included) and its distance field into the state, e.g. from shared memory.
+        :param board_hash: the hash of board, if hashing should be enabled (it is not recomputed).
+        """
+        self._board[...] = board
+        self._distance_field.values[...] = distance_field
+        self._board_hash = board_hash
+        self._checkpoints = []
 
     def get_position(self, player_id):
         pos = self._positions[player_id]
@@ -69,8 +137,10 @@ class State:
         self._angles[player_id] = angle
 
     def reset_arena(self):
-        self._rgb_board[self.margin:self.margin + ARENA_HEIGHT, self.margin:self.margin + ARENA_WIDTH, ...] = BLACK
-        self._board[: ARENA_HEIGHT, : ARENA_WIDTH] = BLACK_2D
+        self._board[self.margin:self.margin + ARENA_HEIGHT, self.margin:self.margin + ARENA_WIDTH] = BLACK_2D
+        self._distance_field.reset()
+        if self._board_hash is not None:
+            self._board_hash = self.calc_board_hash()
 
     def adjust_to_drl_player_no_position(self, player_id):
         features = self.adjust_to_drl_player(player_id)
@@ -78,9 +148,15 @@ class State:
 
     def adjust_to_drl_player(self, player_id):
         ## Feature representation
-        max_dist = 350
-        num_angles = 25
-        return self.get_distance_to_obstacles(self._angles[player_id], self._positions[player_id], num_angles, max_dist)
+        return self.adjust_to_drl_players([player_id])[0]
+
+    def adjust_to_drl_players(self, player_ids):
+        """ Returns the feature vectors of several players at once. All rays of all players are cast in one pass """
+        positions = np.array([self._positions[i] for i in player_ids])
+        angles = np.array([self._angles[i] for i in player_ids])
+        distances = cast_rays(self._board[np.newaxis], positions[np.newaxis], angles[np.newaxis], NUM_RAYS,
+                              MAX_RAY_DISTANCE, self.margin)
+        return distances[0] / MAX_RAY_DISTANCE
 
     @abc.abstractmethod
     def update_player_graphics(self, player_id):
@@ -91,69 +167,255 @@ class State:
         # return copy.deepcopy(other)
         new_state = copy.copy(other)
         new_state.margin = other.margin
-        new_state._rgb_board = other._get_rgb_board().copy()
-        new_state._board = other.get_board().copy()
+        new_state._board = other._board.copy()
+        new_state._distance_field = other._distance_field.copy()
         new_state.colors = other.colors
         new_state._positions = copy.deepcopy(other.get_all_positions())
         new_state.alive = copy.copy(other.alive)
         new_state._angles = copy.copy(other.get_all_angles())
+        new_state.counts = copy.copy(other.counts)
+        new_state._checkpoints = []
+        new_state._pending_marks = []
         return new_state
 
-    def draw_circle(self, color_2d, color, center, radius):
-        circle = CIRCLES[radius - 1]
-        circle = np.array(circle) + np.array(center)
-        circle = np.round(circle).astype(np.int)
-        circle = self.clip(circle)
-        self._rgb_board[circle[..., 1] + self.margin, circle[..., 0] + self.margin, ...] = color
-        self._board[circle[..., 1], circle[..., 0]] = color_2d
+    def push(self):
+        """
+        Opens a checkpoint. Until the matching pop(), every pixel written by draw_circle (and every update of the distance
+        field) is recorded together with its previous value, so pop() can restore the state exactly without copying the
+        board. Checkpoints can be nested.
+        """
+        self._checkpoints.append((list(self._positions), copy.copy(self._angles), list(self.alive), list(self.counts),
+                                  self._board_hash, []))
+
+    def pop(self):
+        """ Restores the state (board, positions, angles and lives) to what it was at the matching push() """
+        positions, angles, alive, counts, board_hash, edits = self._checkpoints.pop()
+        for array, index, values in reversed(edits):
+            array[index] = values
+        # restore in place, the game shares these lists with the state
+        self._positions[:] = positions
+        self._angles[:] = angles
+        self.alive[:] = alive
+        self.counts[:] = counts
+        self._board_hash = board_hash
+
+    def draw_circle(self, color_2d, center, radius):
+        offsets, mask, left, top = STAMPS[radius - 1]
+        x, y = center
+        col, row = round(x) + left, round(y) + top
+        # Away from the edges the circle is its mask, written through a view of the board. Rounding the center once
+        # rounds every pixel the same, except for a center exactly halfway between pixels (np.round rounds half to
+        # even), which takes the general path
+        if (0 <= col and col + mask.shape[1] <= ARENA_WIDTH and 0 <= row and row + mask.shape[0] <= ARENA_HEIGHT and
+                x % 1 != 0.5 and y % 1 != 0.5):
+            self.stamp(color_2d, row + self.margin, col + self.margin, mask)
+            return
+        circle = self.clip(np.round(offsets + center).astype(int))
+        rows, cols = circle[..., 1] + self.margin, circle[..., 0] + self.margin
+        record = len(self._checkpoints) > 0
+        if record:
+            self._checkpoints[-1][-1].append((self._board, (rows, cols), self._board[rows, cols]))
+        if self._board_hash is not None:
+            # clipped circles may hit the same pixel twice, and each pixel must be xored once
+            pixels = np.unique(rows * self._board.shape[1] + cols)
+            keys = get_zobrist_keys(self._board.shape)[pixels]
+            changes = (keys * self._board.ravel()[pixels]) ^ (keys * np.uint64(color_2d))
+            self._board_hash ^= int(np.bitwise_xor.reduce(changes))
+        self._board[rows, cols] = color_2d
+        if color_2d != BLACK_2D:
+            window, previous = self._distance_field.mark(rows, cols, record)
+            if record:
+                self._checkpoints[-1][-1].append((self._distance_field.values, window, previous))
+
+    def stamp(self, color_2d, row, col, mask):
+        """ Draws the pixels of a mask whose top left corner is at (row, col) of the board, like draw_circle """
+        rows, cols = slice(row, row + mask.shape[0]), slice(col, col + mask.shape[1])
+        view = self._board[rows, cols]
+        record = len(self._checkpoints) > 0
+        if record:
+            self._checkpoints[-1][-1].append((view, mask, view[mask]))
+        if self._board_hash is not None:
+            keys = get_zobrist_keys(self._board.shape).reshape(self._board.shape)[rows, cols][mask]
+            changes = (keys * view[mask]) ^ (keys * np.uint64(color_2d))
+            self._board_hash ^= int(np.bitwise_xor.reduce(changes))
+        view[mask] = color_2d
+        if color_2d != BLACK_2D:
+            window, previous = self._distance_field.mark_box(row, rows.stop - 1, col, cols.stop - 1, record)
+            if record:
+                self._checkpoints[-1][-1].append((self._distance_field.values, window, previous))
+
+    def draw_trail(self, player_id, positions, use_color=True):
+        """
+        Draws the body of a player at each of the given positions, in one write. The result is the same as calling
+        draw_player at every position (board, distance field, hash and counts), and positions further apart than
+        TRAIL_SPACING are joined by the stamps in between, as a swept capsule.
+        """
+        color = player_id + 2 if use_color else BLACK_2D
+        self.counts[player_id] += len(positions)
+        if not len(positions):
+            return
+        points = np.array(positions, dtype=float)
+        if len(points) > 1:
+            steps = np.ceil(np.hypot(*np.diff(points, axis=0).T) / TRAIL_SPACING).astype(int)
+            if np.any(steps > 1):
+                points = np.concatenate([points[:1]] + [
+                    start + (end - start) * (np.arange(1, n + 1) / n)[:, np.newaxis]
+                    for start, end, n in zip(points[:-1], points[1:], steps)])
+        offsets = STAMPS[PLAYER_RADIUS - 1][0]
+        circles = self.clip(np.round(offsets + points[:, np.newaxis]).astype(int)) + self.margin
+        width = self._board.shape[1]
+        pixels = np.unique(circles[..., 1] * width + circles[..., 0])
+        board = self._board.reshape(-1)
+        record = len(self._checkpoints) > 0
+        if record:
+            self._checkpoints[-1][-1].append((board, pixels, board[pixels]))
+        if self._board_hash is not None:
+            keys = get_zobrist_keys(self._board.shape)[pixels]
+            self._board_hash ^= int(np.bitwise_xor.reduce((keys * board[pixels]) ^ (keys * np.uint64(color))))
+        board[pixels] = color
+        if color != BLACK_2D:
+            boxes = np.stack([circles[..., 1].min(axis=1), circles[..., 1].max(axis=1), circles[..., 0].min(axis=1),
+                              circles[..., 0].max(axis=1)], axis=1)
+            window, previous = self._distance_field.mark_boxes(boxes, record)
+            if record:
+                self._checkpoints[-1][-1].append((self._distance_field.values, window, previous))
 
     def clip(self, circle):
         circle[circle < 0] = 0
         circle[circle[..., 0] >= ARENA_WIDTH, 0] = ARENA_WIDTH - 10
         circle[circle[..., 1] >= ARENA_HEIGHT, 1] = ARENA_HEIGHT - 10
-        return np.round(circle).astype(np.int)
+        return circle
 
     def draw_player(self, player_id, use_color=False):
         self.counts[player_id] += 1
-        rgb_color = self.colors[player_id] if use_color else BLACK
         color = player_id + 2 if use_color else BLACK_2D
         try:
-            self.draw_circle(color, rgb_color, self._positions[player_id], PLAYER_RADIUS)
+            self.draw_circle(color, self._positions[player_id], PLAYER_RADIUS)
         except:
-            self.draw_circle(color, rgb_color, self._positions[player_id], PLAYER_RADIUS)
+            self.draw_circle(color, self._positions[player_id], PLAYER_RADIUS)
 
     def draw_head(self, position):
         try:
-            self.draw_circle(HEAD_2D, HEAD_COLOR, position, HEAD_RADIUS)
+            self.draw_circle(HEAD_2D, position, HEAD_RADIUS)
         except:
-            self.draw_circle(HEAD_2D, HEAD_COLOR, position, HEAD_RADIUS)
+            self.draw_circle(HEAD_2D, position, HEAD_RADIUS)
+
+    def draw_players(self, head_positions, colors, defer_marks=False):
+        """
+        Draws the head and the body of every player, in the order head 0, body 0, head 1, body 1, ... The result is the
+        same as calling draw_head and draw_player for every player (board, distance field, hash and counts), but all
+        the circles are written at once.
+        :param head_positions: the head position of every player.
+        :param colors: the 2d color of every player's body (BLACK_2D in a drawing gap).
+        :param defer_marks: if True, the distance field is not lowered until apply_pending_marks is called.
+        """
+        if self._checkpoints:  # the edits must be recorded circle by circle
+            for i, (head_position, color) in enumerate(zip(head_positions, colors)):
+                self.draw_head(head_position)
+                self.counts[i] += 1
+                self.draw_circle(color, self._positions[i], PLAYER_RADIUS)
+            return
+        colors = np.asarray(colors, dtype=np.uint8)
+        heads = self.clip(np.round(HEAD_CIRCLE + np.array(head_positions)[:, np.newaxis]).astype(int))
+        bodies = self.clip(np.round(PLAYER_CIRCLE + np.array(self._positions)[:, np.newaxis]).astype(int))
+        width = self._board.shape[1]
+        heads = (heads[..., 1] + self.margin) * width + heads[..., 0] + self.margin
+        bodies = (bodies[..., 1] + self.margin) * width + bodies[..., 0] + self.margin
+        pixels = np.concatenate([heads, bodies], axis=1).ravel()
+        values = np.concatenate([np.full(heads.shape, HEAD_2D, dtype=np.uint8),
+                                 np.repeat(colors[:, np.newaxis], bodies.shape[1], axis=1)], axis=1).ravel()
+        # where circles overlap, the last one drawn wins
+        pixels, last = np.unique(pixels[::-1], return_index=True)
+        values = values[::-1][last]
+        board = self._board.ravel()
+        if self._board_hash is not None:
+            keys = get_zobrist_keys(self._board.shape)[pixels]
+            self._board_hash ^= int(np.bitwise_xor.reduce((keys * board[pixels]) ^ (keys * values.astype(np.uint64))))
+        board[pixels] = values
+        for i in range(len(colors)):
+            self.counts[i] += 1
+
+        # the box of every circle, for the distance field
+        boxes = []
+        for circles in (heads, bodies):
+            rows, cols = np.divmod(circles, width)
+            boxes.append(np.stack([rows.min(axis=1), rows.max(axis=1), cols.min(axis=1), cols.max(axis=1)], axis=1))
+        boxes = np.stack(boxes, axis=1)  # players x (head, body) x 4
+        drawn = np.stack([np.ones(len(colors), dtype=bool), colors != BLACK_2D], axis=1)
+        self._pending_marks.append((boxes, drawn))
+        if not defer_marks:
+            self.apply_pending_marks()
+
+    def apply_pending_marks(self):
+        """ Lowers the distance field around the circles drawn by draw_players, once per player """
+        if not self._pending_marks:
+            return
+        boxes = np.concatenate([player_boxes for player_boxes, _ in self._pending_marks], axis=1)
+        drawn = np.concatenate([player_drawn for _, player_drawn in self._pending_marks], axis=1)
+        self._pending_marks = []
+        for player_boxes, player_drawn in zip(boxes, drawn):
+            self._distance_field.mark_boxes(player_boxes[player_drawn])
+
+    def is_recording(self):
+        """ Returns True iff a checkpoint is open (see push) """
+        return len(self._checkpoints) > 0
 
     def is_terminal_state(self):
         return np.sum(self.alive) < 1
 
     def get_distance_to_obstacles(self, initial_angle, position, num_angles, max_distance=150):
-        angles = [(-np.pi / 2) + ((i / (num_angles - 1)) * np.pi) for i in range(num_angles)]
-        angles = initial_angle + np.array(angles)
-        distances = np.zeros_like(angles)
-        for i, angle in enumerate(angles):
-            distances[i] = self.distance_to_obstacle(position, angle, max_distance)
-        return distances / max_distance
+        distances = cast_rays(self._board[np.newaxis], np.array([[position]]), np.array([[initial_angle]]),
+                              num_angles, max_distance, self.margin)
+        return distances[0, 0] / max_distance
 
     def distance_to_obstacle(self, position, angle, max_distance=150):
-        position = np.array(position) + self.margin
-        distances = np.arange(10, max_distance)
-        xx = position[0] + (np.cos(angle) * distances)
-        yy = position[1] - (np.sin(angle) * distances)
-        xx = np.round(xx).astype(np.int)
-        yy = np.round(yy).astype(np.int)
-        xx[xx < self.margin] = self.margin - 1
-        yy[yy < self.margin] = self.margin - 1
-        xx[xx >= ARENA_WIDTH + (self.margin * 2)] = ARENA_WIDTH + (self.margin * 2) - 1
-        yy[yy >= ARENA_HEIGHT + (self.margin * 2)] = ARENA_HEIGHT + (self.margin * 2) - 1
-        nonzero = np.nonzero(self._rgb_board[yy, xx, ...])
-        if len(nonzero[0]) > 0:
-            return np.linalg.norm(position - np.array([xx[nonzero[0][0]], yy[nonzero[0][0]]]))
-        return max_distance
+        distance = self.ray_march(position, angle, MIN_RAY_DISTANCE, 1, max_distance - MIN_RAY_DISTANCE)
+        if distance is None:
+            return max_distance
+        x, y = self.get_ray_sample(position, angle, distance)
+        return math.hypot(position[0] + self.margin - x, position[1] + self.margin - y)
+
+    def get_ray_sample(self, position, angle, distance):
+        """ Returns the pixel (x, y) of the board sampled by a ray at the given distance, clipped onto the margin """
+        height, width = self._board.shape
+        x = round(position[0] + self.margin + float(np.cos(angle)) * distance)
+        y = round(position[1] + self.margin - float(np.sin(angle)) * distance)
+        return min(max(x, self.margin - 1), width - 1), min(max(y, self.margin - 1), height - 1)
+
+    def ray_march(self, position, angle, start, step, num_samples, trails_only=False):
+        """
+        Walks the samples position + (start + k * step) * (cos(angle), -sin(angle)), k = 0, ..., num_samples - 1, and
+        returns the distance of the first one that hits an obstacle, or None. The distance field is used to jump over
+        samples that are known to be empty, so the result is the same as testing every sample, at a fraction of the
+        lookups.
+        :param trails_only: if True, a sample hits if it is out of the arena or on a trail (like detect_collision).
+               Otherwise it hits any non empty pixel, and samples that leave the arena are clipped onto the margin (like
+               the ray sensors).
+        """
+        dx, dy = float(np.cos(angle)), -float(np.sin(angle))
+        x0, y0 = position[0] + self.margin, position[1] + self.margin
+        height, width = self._board.shape
+        low = self.margin - 1
+        # consecutive samples are at most stride pixels apart (Chebyshev), and rounding adds at most one pixel
+        stride = step * max(abs(dx), abs(dy))
+        k = 0
+        while k < num_samples:
+            distance = start + k * step
+            x, y = round(x0 + dx * distance), round(y0 + dy * distance)
+            if trails_only:
+                if not (low < x < width - self.margin and low < y < height - self.margin):
+                    return distance
+            else:
+                x, y = min(max(x, low), width - 1), min(max(y, low), height - 1)
+            radius = self._distance_field.safe_radius(y, x)
+            if radius < 0:
+                pixel = self._board.item(y, x)
+                if pixel > HEAD_2D or (pixel != BLACK_2D and not trails_only):
+                    return distance
+                k += 1
+            else:
+                k += 1 + max(int((radius - 1) / stride - 1e-9), 0)
+        return None
 
     def get_player_drl_features(self, player_id):
         features = [self._positions[player_id][0] / ARENA_WIDTH, self._positions[player_id][1] / ARENA_HEIGHT]
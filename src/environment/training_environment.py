@@ -1,8 +1,6 @@
 ### IMPORTS ###
 import numpy as np
-from game.players.player_factory import PlayerFactory
-from game.achtung_environment import AchtungEnv
-from game.players.drl_player import DRLPlayer
+from src.environment.engine import AchtungEngine
 
 
 ### Setting path variables ###
@@ -14,9 +12,9 @@ from game.players.drl_player import DRLPlayer
 # from players.bulb import Bulb, SpeedBulb, SlowBulb, InvertedBulb, ClearBulb
 
 
-class TrainingEnv(AchtungEnv):
+class TrainingEnv(AchtungEngine):
     def __init__(self, players, training_mode=False, with_positions=True):
-        AchtungEnv.__init__(self, training_mode)
+        AchtungEngine.__init__(self, training_mode)
         self.initialize(players)
         self.use_positions = with_positions
 
@@ -26,6 +24,7 @@ class TrainingEnv(AchtungEnv):
         return self.state.adjust_to_drl_player_no_position(player_id)
 
     def set_player(self, player_id, *args):
+        from src.players.drl_player import DRLPlayer  # tensorflow is only needed once a DRL opponent is set
         self.players[player_id] = DRLPlayer(player_id, self, *args)
 
     def get_legal_actions(self, state=None, player_id=0):
@@ -34,12 +33,9 @@ class TrainingEnv(AchtungEnv):
     def step(self, action, player_id=0):
         if not self.state.alive[player_id]:  # or self.state.is_terminal_state():
             return None, 0
-        for i, player in enumerate(self.players):
-            if self.state.alive[i]:
-                if i == player_id:
-                    self.actions[i] = action
-                else:
-                    self.actions[i] = player.get_action(self.state)
-        for _ in range(self.action_sampling_rate):
-            self.tick()
+        self.actions[player_id] = action
+        others = [i for i in range(len(self.players)) if i != player_id and self.state.alive[i]]
+        for i, other_action in zip(others, self.get_actions(others)):
+            self.actions[i] = other_action
+        self.advance(self.action_sampling_rate)
         return self.get_state(player_id), 1
@@ -1,129 +1,275 @@
 import random
+import time
 
 from src.players.player import Player
 import numpy as np
 import itertools
 from static.settings import *
 from src.environment.state import State
+from src.players.territory import TerritoryHeuristic
+from src.players.transposition_table import TranspositionTable, get_position_key, EXACT, LOWER_BOUND, UPPER_BOUND
+from src.players.parallel_search import ParallelSearch
+from src.players.search_stats import SearchStats
 from typing import List
 
+TERRITORY_WEIGHT = 0.2  # the weight of the territory score in the value of a leaf
+OPPONENT_SAMPLES = 2  # the joint opponent moves searched in a min node
+
+
+class SearchTimeout(Exception):
+    """ Raised inside the search when the time budget of the move is over """
+    pass
+
 
 class AlphaBetaPlayer(Player):
 
-    def __init__(self, player_id, game, depth: int):
+    def __init__(self, player_id, game, depth: int, use_transposition_table=True, time_budget=None, seed=None,
+                 num_workers=0, search_stats=False):
+        """
+        :param depth: the depth of the search. With a time budget, the maximal depth of the iterative deepening.
+        :param time_budget: if not None, the time in milliseconds of every move. The search deepens iteratively, and
+               the move of the deepest completed iteration is played when the time is over.
+        :param seed: if not None, the opponent moves sampled in a node (and the tie breaking at the root) are a function
+               of the seed and the position only, so a search always gives the same result.
+        :param num_workers: if positive, fixed depth searches are split between num_workers processes. Requires a seed,
+               0 is used if none is given.
+        :param search_stats: if True, the statistics of every move are recorded in self.search_stats (see
+               search_stats.py).
+        """
         super().__init__(player_id, game)
-        # print("Number of processors: ", mp.cpu_count())
         self.total_time = 0
         self.depth = depth  # the depth of the minmax (how many moves we look ahead)
+        self.time_budget = time_budget
+        self.deadline = None
+        self.depth_history = []  # the depth reached in every move of a timed search
         self.initial_opponents = []
         self.opponents = []
         self.n_of_opp = 0
         self.all_actions = []
         self.first_round = True
-        # self.pool = mp.Pool(mp.cpu_count())
+        if seed is None and num_workers > 0:
+            seed = 0  # the workers must sample the same opponent moves as a serial search
+        self.seed = seed
+        self.num_workers = num_workers
+        self.parallel_search = None  # created on the first search, once the board shape is known
         self.states_evaluated = 0
         self.successors_generated = 0
+        self.tt_lookups = 0
+        self.tt_hits = 0
+        self.cutoffs = 0
+        self.transposition_table = TranspositionTable() if use_transposition_table else None
+        self.heuristic = AlphaBetaHeuristic(self, game)
+        self.search_stats = None
+        if search_stats:
+            self.search_stats = SearchStats({'depth': depth, 'time_budget': time_budget,
+                                             'territory_weight': TERRITORY_WEIGHT, 'opponent_samples': OPPONENT_SAMPLES,
+                                             'transposition_table': use_transposition_table})
+            self.search_stats.instrument(self)
 
     def get_action(self, state):
-        state_copy = State.from_state(state)
-        if 1 < len(state_copy.alive) < self.n_of_opp or self.first_round:
-            self.update_opponents(state_copy)
-        values = []
-        initial_position = self.get_initial_positions([self.id], state_copy)
-        for action in [RIGHT, LEFT, STRAIGHT]:
+        start = time.perf_counter()
+        if self.search_stats is not None:
+            self.search_stats.begin_move(self)
+        action = self.search(state)
+        self.total_time += time.perf_counter() - start
+        if self.search_stats is not None:
+            self.search_stats.end_move(self, self.depth if self.time_budget is None else self.depth_history[-1])
+        return action
+
+    def search(self, state):
+        # The search edits the given state and undoes every edit with state.pop(), so the board is never copied
+        self.update_opponents(state)
+        if self.transposition_table is not None or self.seed is not None:
+            state.enable_hashing()
+        if self.time_budget is not None:
+            return self.iterative_deepening(state)
+        if self.num_workers > 0:
+            return self.choose_action(self.get_parallel_search(state).search_root(self, state, self.depth), state)
+        return self.choose_action(self.search_root(state, self.depth, ACTIONS), state)
+
+    def get_parallel_search(self, state):
+        if self.parallel_search is None:
+            self.parallel_search = ParallelSearch(self.num_workers, state.get_full_board().shape,
+                                                  state.get_distance_field().values.shape, len(state.alive))
+        return self.parallel_search
+
+    def close(self):
+        """ Stops the worker processes of a parallel search """
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+            self.parallel_search = None
+
+    def iterative_deepening(self, state):
+        """
+        Searches deeper and deeper until the time budget is over, and returns the best action of the deepest completed
+        search. Every iteration tries the root actions in the order of the values of the previous one, and the
+        transposition table orders the max nodes along the previous principal variation.
+        """
+        self.deadline = time.perf_counter() + self.time_budget / 1000
+        order = list(ACTIONS)
+        values, reached_depth = None, -1
+        try:
+            for depth in range(self.depth + 1):
+                values = self.search_root(state, depth, order)
+                reached_depth = depth
+                order.sort(key=lambda action: values[action], reverse=True)
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        self.depth_history.append(reached_depth)
+        if values is None:
+            return STRAIGHT
+        return self.choose_action(values, state)
+
+    def search_root(self, state, depth, actions):
+        """ Returns the value of every action (indexed by action), searched to the given depth in the given order """
+        values = [-np.inf for _ in ACTIONS]
+        for action in actions:
             self.successors_generated += 1
-            self.update_successor_state([self.id], state_copy, [action], initial_position, True)
-            values.append(self.alpha_beta(state_copy, self.depth, -np.inf, np.inf, False, action))
-            self.update_successor_state([self.id], state_copy, [action], initial_position, False)
-
+            state.push()
+            opponent_died = self.update_successor_state([self.id], state, [action])
+            try:
+                values[action] = self.alpha_beta(state, depth, -np.inf, np.inf, False, action)
+            finally:
+                self.undo_successor_state(state, opponent_died)
+        return values
+
+    def choose_action(self, values, state):
         max_vals = [i for i, val in enumerate(values) if val == max(values)]
-        chosen_action = min(max_vals) if len(max_vals) <= 2 else random.choice(max_vals)
+        return min(max_vals) if len(max_vals) <= 2 else self.get_random(state, -1).choice(max_vals)
+
+    def get_random(self, state, depth):
+        """ Returns the random generator of a node: the global one, or, with a seed, one seeded by the position """
+        if self.seed is None:
+            return random
+        return random.Random(hash((self.seed, get_position_key(state, False), depth)))
 
-        return chosen_action
+    def sample_opponent_actions(self, state, depth):
+        return self.get_random(state, depth).sample(self.all_actions, min(OPPONENT_SAMPLES, len(self.all_actions)))
 
     def alpha_beta(self, state, depth, alpha, beta, max_player, potential_action):
+        """ Searches the node, and looks it up in (and stores it to) the transposition table if there is one """
+        if self.transposition_table is None:
+            return self.search_node(state, depth, alpha, beta, max_player, potential_action)[0]
+        key = get_position_key(state, max_player)
+        self.tt_lookups += 1
+        entry = self.transposition_table.get(key)
+        best_move = None
+        if entry is not None:
+            value, entry_depth, flag, best_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    self.tt_hits += 1
+                    return value
+                if flag == LOWER_BOUND and value > alpha:
+                    self.tt_hits += 1
+                    alpha = value
+                elif flag == UPPER_BOUND and value < beta:
+                    self.tt_hits += 1
+                    beta = value
+                if alpha >= beta:
+                    return value
+        alpha_orig, beta_orig = alpha, beta
+        value, best_move = self.search_node(state, depth, alpha, beta, max_player, potential_action, best_move)
+        if value <= alpha_orig:
+            flag = UPPER_BOUND
+        elif value >= beta_orig:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.transposition_table.put(key, value, depth, flag, best_move)
+        return value
+
+    def search_node(self, state, depth, alpha, beta, max_player, potential_action, first_move=None):
+        """
+        :param first_move: a move to try first in a max node, usually the best move of a previous search.
+        :return: a tuple (value, best_move). best_move is the best action of a max node, and None in other nodes.
+        """
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
         if depth == 0:
             fill_value, nearest_opponent = self.calc_fill_value(state)
             closest_obstacle_value = self.closest_obstacle_value(state, potential_action)
-            weights = np.array([1, 0.2, 1])
+            weights = np.array([1, TERRITORY_WEIGHT, 1])
             values = np.array([closest_obstacle_value, fill_value, nearest_opponent]).astype(int)
             tmp = np.multiply(values, weights)
-            return np.sum(tmp)
+            return np.sum(tmp), None
         if max_player:  # the alpha_beta_player is max
-            value = -np.inf
-            initial_position = self.get_initial_positions([self.id], state)
-            for action in [RIGHT, LEFT, STRAIGHT]:
+            value, best_move = -np.inf, None
+            actions = [RIGHT, LEFT, STRAIGHT]
+            if first_move is not None:
+                actions.remove(first_move)
+                actions.insert(0, first_move)
+            for action in actions:
                 self.successors_generated += 1
-                self.update_successor_state([self.id], state, [action], initial_position, True)
-                value = max(value, self.alpha_beta(state, depth - 1, alpha, beta, False, action))
-                self.update_successor_state([self.id], state, [action], initial_position, False)
+                state.push()
+                opponent_died = self.update_successor_state([self.id], state, [action])
+                try:
+                    action_value = self.alpha_beta(state, depth - 1, alpha, beta, False, action)
+                finally:
+                    self.undo_successor_state(state, opponent_died)
+                if action_value > value:
+                    value, best_move = action_value, action
                 alpha = max(alpha, value)
                 if alpha >= beta:
+                    self.cutoffs += 1
                     break
-            return value
+            return value, best_move
         else:  # all of the other players are the opponent that is min
             value = self.closest_obstacle_value(state, potential_action)
             if len(self.all_actions) != 0:
                 value = np.inf
-                all_actions = random.sample(self.all_actions, 2)
-                initial_position = self.get_initial_positions(self.opponents, state)
+                all_actions = self.sample_opponent_actions(state, depth)
+                opponents = self.opponents
                 for actions in all_actions:
                     self.successors_generated += 1
-                    opponents = self.opponents
-                    self.update_successor_state(opponents, state, actions, initial_position, True)
-                    value = min(value, self.alpha_beta(state, depth - 1, alpha, beta, True, potential_action))
-                    self.update_successor_state(opponents, state, actions, initial_position, False)
+                    state.push()
+                    opponent_died = self.update_successor_state(opponents, state, actions)
+                    try:
+                        value = min(value, self.alpha_beta(state, depth - 1, alpha, beta, True, potential_action))
+                    finally:
+                        self.undo_successor_state(state, opponent_died)
                     beta = min(beta, value)
                     if beta <= alpha:
+                        self.cutoffs += 1
                         break
-            return value
-
-    def update_successor_state(self, player_ids: List[int], state: State, actions: List[int], initial_positions,
-                               forward):
+            return value, None
+
+    def update_successor_state(self, player_ids: List[int], state: State, actions: List[int]):
+        """
+        Advances the specified players by one action (action_sampling_rate moves) in the given state. The caller is
+        expected to have called state.push(), and to undo the move with undo_successor_state.
+        :return: True iff one of the opponents died during the move.
+        """
+        opponent_died = False
         for i, player in enumerate(player_ids):
-            positions_to_erase = []
-            position = initial_positions[i][0]
-            angle = initial_positions[i][1]
-            for _ in range(5):
+            position = state.get_position(player)
+            angle = state.get_angle(player)
+            # the body is drawn once, after the moves: the head is ahead of the body, so it can not run into the body
+            # drawn during the same action
+            trail = []
+            for _ in range(self.game.action_sampling_rate):
                 position, angle = self.game.update_pos_angle(position, angle, actions[i])
-                if not forward:
-                    positions_to_erase.append((position, angle))
-                else:
-                    state.set_position(player, position)
-                    state.set_angle(player, angle)
-                    if self.game.detect_collision(player, state):
-                        state.alive[player] = False
-                        if player != self.id:
-                            self.update_opponents(state)
-                        break
-                    state.draw_player(player, True)
-
-            # if not player_died or not forward:
-            if not forward:
-                if not state.alive[player]:
-                    state.alive[player] = True
+                state.set_position(player, position)
+                state.set_angle(player, angle)
+                if self.game.detect_collision(player, state):
+                    state.alive[player] = False
                     if player != self.id:
+                        opponent_died = True
                         self.update_opponents(state)
-                erase_head = True
-                for pos, angle in positions_to_erase[::-1]:
-                    if self.game.in_bounds(pos) and state.get_2d_pixel(pos) == (player + 2) or not erase_head:
-                        if erase_head:
-                            state.draw_circle(BLACK_2D, BLACK,
-                                              self.game.get_head_position(pos, angle), HEAD_RADIUS)
-                            erase_head = False
-                        state.draw_circle(BLACK_2D, BLACK, pos, PLAYER_RADIUS)
-                state.set_position(player, initial_positions[i][0])
-                state.set_angle(player, initial_positions[i][1])
-                state.draw_player(player)
+                    break
+                trail.append(position)
+            state.draw_trail(player, trail)
             if state.alive[player]:
                 head_position = self.game.get_head_position(state.get_position(player), state.get_angle(player))
                 state.draw_head(head_position)
+        return opponent_died
 
-    def get_initial_positions(self, player_ids, state):
-        initial_pos = []
-        for player in player_ids:
-            initial_pos.append((state.get_position(player), state.get_angle(player)))
-        return initial_pos
+    def undo_successor_state(self, state: State, opponent_died):
+        state.pop()
+        if opponent_died:
+            self.update_opponents(state)
 
     def closest_obstacle_value(self, state, action):
         self.states_evaluated += 1
@@ -132,12 +278,13 @@ class AlphaBetaPlayer(Player):
         new_angle = state.get_angle(self.id)
         if self.game.detect_collision(self.id, state) or not state.alive[self.id]:
             value -= 100
-        for i in range(40, 0, -1):
-            new_pos = self.game.calculate_new_position(new_pos, new_angle)
-            head_pos = self.game.get_head_position(new_pos, new_angle)
-            if self.game.detect_collision(self.id, state, head_pos):
-                value -= 10 * i
-                break
+        # walk the head along the next 40 straight moves, the earlier the collision the lower the value
+        head_distance = self.game.player_radius * 1.5
+        distance = state.ray_march(new_pos, new_angle, head_distance + self.game.player_speed, self.game.player_speed,
+                                   40, trails_only=True)
+        if distance is not None:
+            i = 40 - int(round((distance - head_distance) / self.game.player_speed)) + 1
+            value -= 10 * i
         return value
 
     def update_opponents(self, state):
@@ -150,110 +297,51 @@ class AlphaBetaPlayer(Player):
             self.all_actions = list(itertools.product(range(3), repeat=self.n_of_opp - 1))
 
     def calc_fill_value(self, state):
-        ab_heuristic = AlphaBetaHeuristic(self, self.game, state, self.opponents)
-        positions = state.get_all_positions()
-        angles = state.get_all_angles()
-        score, euclidean_distance = ab_heuristic.score_function(positions, angles)
-        return score, euclidean_distance
+        return self.heuristic.score_function(state, self.opponents)
 
 
 NEGATIVE_SCORE = 1000 * -127
-SUB_SAMPLE_FACTOR = 1
-FILL_FACTOR = 20
 NUM_ANGLES = 2
-DIST_FACTOR = 2 * FILL_FACTOR
 POS_FACTOR = 300
 
 class AlphaBetaHeuristic:
-    def __init__(self, player, game, state, opponents):
+    def __init__(self, player, game):
         self.player = player
         self.game = game
-        self.state = state
-        self.opponents = opponents
-
-    def calc_distances(self, start, old_angle):
-        start = int(round(start[0])), int(round(start[1]))
-        distances = np.ones((int(ARENA_WIDTH / SUB_SAMPLE_FACTOR), int(ARENA_HEIGHT / SUB_SAMPLE_FACTOR))) * 100
-        distances[start[0], start[1]] = 0
-        front = {(start, old_angle)}
-
-        flag = False
-
-        while len(front):
-            old_position, old_angle = front.pop()
-            legal_moves = []
-            for action in ACTIONS:
-                new_angle = self.game.calculate_new_angle(old_angle, action)
-                new_position = self.game.get_head_position(old_position, new_angle)
-                new_position = int(round(new_position[0])), int(round(new_position[1]))
-                if self.game.in_bounds(new_position) and self.state.is_2d_pos_available(new_position):
-                    legal_moves.append((new_position, new_angle))
-
-            for new_position, new_angle in legal_moves:
-                if not self.game.in_bounds(new_position):
-                    continue
-                new_distance = distances[old_position[0], old_position[1]] + 1
-                old_distance = distances[new_position[0], new_position[1]]
-                if new_distance < old_distance:
-                    distances[new_position[0], new_position[1]] = new_distance
-                    if len(front) == FILL_FACTOR:
-                        flag = True
-                        break
-                    front.add((new_position, new_angle))
-            if flag:
-                break
-        return distances
+        self.territory = TerritoryHeuristic()
 
-    def score_function(self, positions, angles):
+    def score_function(self, state, opponents):
+        """
+        :return: a tuple (score, euclidean_distance). The score is the number of cells the max player reaches before
+                 its opponents, minus the number of cells they reach before it.
+        """
+        positions = state.get_all_positions()
+        angles = state.get_all_angles()
         max_player_pos = positions[self.player.id]
         max_player_angle = angles[self.player.id]
-        opponents_angles = [angles[i] for i in self.opponents]
-        opponents_pos, euclidean_distance = self.get_euclidean_dist_and_pos(max_player_angle, max_player_pos,
-                                                                            positions)
-        if len(opponents_pos) < 1:
-            return 0, euclidean_distance
-
-        # max_player_pos = int(max_player_pos[0] / SUB_SAMPLE_FACTOR), int(max_player_pos[1] / SUB_SAMPLE_FACTOR)
-        # opponents_pos = [(int(pos[0] / SUB_SAMPLE_FACTOR), int(pos[1] / SUB_SAMPLE_FACTOR)) for pos in opponents_pos]
-        # distances = np.ones(
-        #     (int(ARENA_WIDTH / SUB_SAMPLE_FACTOR), int(ARENA_HEIGHT / SUB_SAMPLE_FACTOR), len(opponents_pos)))
-
-        if self.game.detect_collision(self.player.id, self.state) or not self.state.alive[self.player.id]:
+        euclidean_distance = self.get_euclidean_distance(max_player_angle, max_player_pos, positions, opponents)
+
+        if self.game.detect_collision(self.player.id, state) or not state.alive[self.player.id]:
             return NEGATIVE_SCORE, euclidean_distance  # Return a very negative score
 
-        nearest_tiles_max_player, nearest_tiles_opponents = self.get_distance_values(max_player_angle,
-                                                                                     max_player_pos, opponents_angles,
-                                                                                     opponents_pos)
+        max_player_head = self.game.get_head_position(max_player_pos, max_player_angle)
+        opponents_heads = [self.game.get_head_position(positions[i], angles[i]) for i in opponents]
+        nearest_tiles_max_player, nearest_tiles_opponents = self.territory.split(state, max_player_head,
+                                                                                 opponents_heads)
         diff = nearest_tiles_max_player - nearest_tiles_opponents
         return diff, euclidean_distance
 
-    def get_distance_values(self, max_player_angle, max_player_pos, opponents_angles, opponents_pos):
-        distances = np.ones((ARENA_WIDTH, ARENA_HEIGHT, len(opponents_pos)))
-        max_player_distances = np.ones((int(ARENA_WIDTH / SUB_SAMPLE_FACTOR), int(ARENA_HEIGHT / SUB_SAMPLE_FACTOR), 1))
-        max_player_distances[:, :, 0] = self.calc_distances(max_player_pos, max_player_angle)
-        for i in range(len(opponents_pos)):
-            distances[:, :, i] = self.calc_distances(opponents_pos[i], opponents_angles[i])
-        opponents_distances = np.amin(distances, axis=2)
-
-        # Calculate difference in number of tiles the players can reach first
-        nearest_tiles_max_player = np.sum(max_player_distances[:, :, 0] < opponents_distances[:, :])
-        nearest_tiles_opponents = np.sum(max_player_distances[:, :, 0] > opponents_distances[:, :])
-        return nearest_tiles_max_player, nearest_tiles_opponents
-
-    def get_euclidean_dist_and_pos(self, max_player_angle, max_player_pos, positions):
-        tmp_opponents_pos = [positions[i] for i in self.opponents]
+    def get_euclidean_distance(self, max_player_angle, max_player_pos, positions, opponents):
         front_angles = calc_angles(max_player_angle)
-        opponents_pos, euclidean_distances = [], []
-        for pos in tmp_opponents_pos:
+        euclidean_distances = []
+        for pos in [positions[i] for i in opponents]:
             dist = self.game.distance_between_two_pos(max_player_pos, pos)
             if is_pos_within_range(max_player_pos, max_player_angle, pos, front_angles[0], front_angles[1]):
                 euclidean_distances.append(dist)
-            if dist < DIST_FACTOR:
-                opponents_pos.append(pos)
         euclidean_distances = np.array(euclidean_distances)
         euclidean_distance = POS_FACTOR if len(euclidean_distances) == 0 else np.amin(euclidean_distances, axis=0)
 
-        return opponents_pos, euclidean_distance * 0.1
+        return euclidean_distance * 0.1
 
 
 def calc_angles(initial_angle):
@@ -1,17 +1,30 @@
 from src.players.player import Player
 import numpy as np
+import os
+import glob
 import json
 from tensorflow.keras.models import model_from_json
+from src.double_dqn.fast_inference import get_inference_net
+
+
+# The loaded models and their inference nets, by (model_path, weight_path). DRL players of the same files share them, so
+# they have the same policy and choose their actions in one batch (see AchtungEngine.get_actions). Every entry keeps the
+# modification time and size of the files it was loaded from, and files rewritten since (e.g. by a training session)
+# are loaded again; players created before keep the model they were created with.
+_loaded_models = {}
 
 
 class DRLPlayer(Player):
     def __init__(self, player_id, game, model_path, weight_path):
         super().__init__(player_id, game)
-        with open(model_path, 'r') as json_file:
-            config = json.load(json_file)
-            model = model_from_json(config)
-            model.load_weights(weight_path).expect_partial()
-        self._net = model
+        stamp = get_files_stamp(model_path, weight_path)
+        if _loaded_models.get((model_path, weight_path), (None,))[0] != stamp:
+            with open(model_path, 'r') as json_file:
+                config = json.load(json_file)
+                model = model_from_json(config)
+                model.load_weights(weight_path).expect_partial()
+            _loaded_models[model_path, weight_path] = stamp, model, get_inference_net(model)
+        _, self._net, self._inference_net = _loaded_models[model_path, weight_path]
         self.predictions = 0
         self.total_time = 0
 
@@ -20,5 +33,24 @@ class DRLPlayer(Player):
         #     print(f'average action takes {self.total_time / self.predictions} seconds')
         self.predictions += 1
         drl_state = state.adjust_to_drl_player(self.id)  # self.crop_box(state.board, state.positions)
-        values = self._net(drl_state[np.newaxis, ...], training=False)
+        values = self._inference_net(drl_state[np.newaxis, ...])[0]
         return np.random.choice(np.flatnonzero(values == np.max(values)))
+
+    def get_policy(self):
+        return self._inference_net
+
+    def get_actions(self, players, state):
+        """ Returns the actions of DRL players of the same model, with one feature extraction and one forward pass """
+        for player in players:
+            player.predictions += 1
+        all_values = self._inference_net(state.adjust_to_drl_players([player.id for player in players]))
+        return [np.random.choice(np.flatnonzero(values == np.max(values))) for values in all_values]
+
+
+def get_files_stamp(model_path, weight_path):
+    """
+    Returns the (path, modification time, size) of every file of a model: the JSON config, and the weights, either a
+    single file or the index and data files of a TensorFlow checkpoint.
+    """
+    paths = [model_path, weight_path, weight_path + '.index'] + sorted(glob.glob(glob.escape(weight_path) + '.data-*'))
+    return tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths if os.path.isfile(path))
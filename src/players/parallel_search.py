@@ -0,0 +1,128 @@
+import weakref
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from static.settings import *
+
+# Root-parallel alpha-beta. The main process splits the search at the root actions, and, below each of them, at the two
+# sampled opponent moves, and a persistent pool of workers searches the subtrees. The board and its distance field are
+# published once per move in shared memory, and every task only carries the small per-player lists. Every subtree is
+# searched with a full window, and the opponent moves are sampled from the position itself (see
+# AlphaBetaPlayer.sample_opponent_actions), so the root values are the same as the ones of the serial search. The pool
+# and the shared memory are released by close(), or else when the search is garbage collected or the interpreter exits
+# (the game ends with sys.exit, without closing its players).
+
+# The state of a worker process, created by _init_worker
+_worker = {}
+
+
+class ParallelSearch(object):
+
+    def __init__(self, num_workers, board_shape, field_shape, num_players):
+        self.num_workers = num_workers
+        self.board_shape = board_shape
+        self.field_shape = field_shape
+        board_size = int(np.prod(board_shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=board_size + int(np.prod(field_shape)))
+        self._board = np.ndarray(board_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._field = np.ndarray(field_shape, dtype=np.uint8, buffer=self._shm.buf, offset=board_size)
+        self._pool = mp.Pool(num_workers, initializer=_init_worker,
+                             initargs=(self._shm.name, board_shape, field_shape, num_players))
+        self._finalizer = weakref.finalize(self, _release, self._pool, self._shm)
+
+    def search_root(self, player, state, depth):
+        """
+        Returns the value of every root action of player (indexed by action), searched to the given depth. The player's
+        counters are updated with the work done by the workers.
+        """
+        self._board[...] = state.get_full_board()
+        self._field[...] = state.get_distance_field().values
+        root = (list(state.get_all_positions()), list(state.get_all_angles()), list(state.alive),
+                state.get_board_hash(), list(player.opponents), list(player.all_actions), player.n_of_opp)
+        tasks = []
+        for action in ACTIONS:
+            player.successors_generated += 1
+            state.push()
+            opponent_died = player.update_successor_state([player.id], state, [action])
+            if depth == 0 or len(player.all_actions) == 0:
+                tasks.append((action, None))
+            else:
+                # the min node is searched here, and each of its children by a worker
+                player.states_evaluated += 1
+                player.successors_generated += 2
+                tasks.extend((action, opponent_actions) for opponent_actions in
+                             player.sample_opponent_actions(state, depth))
+            player.undo_successor_state(state, opponent_died)
+
+        settings = (player.id, depth, player.seed, player.transposition_table is not None)
+        results = self._pool.map(_search_subtree, [(settings, root, task) for task in tasks])
+        values = [np.inf for _ in ACTIONS]
+        for (action, _), (value, counters) in zip(tasks, results):
+            values[action] = min(values[action], value)
+            player.states_evaluated += counters[0]
+            player.successors_generated += counters[1]
+            player.tt_lookups += counters[2]
+            player.tt_hits += counters[3]
+        return values
+
+    def close(self):
+        self._board = self._field = None  # the views of the shared memory must be gone before it is closed
+        self._finalizer()
+
+
+def _release(pool, shm):
+    """ stops the workers and frees the shared memory, once (see weakref.finalize) """
+    pool.close()
+    pool.join()
+    shm.close()
+    shm.unlink()
+
+
+def _init_worker(shm_name, board_shape, field_shape, num_players):
+    # imported here, the engine imports the player factory which imports this module
+    from src.environment.engine import AchtungEngine
+    from src.environment.state import State
+    _worker['shm'] = shared_memory.SharedMemory(name=shm_name)
+    _worker['board'] = np.ndarray(board_shape, dtype=np.uint8, buffer=_worker['shm'].buf)
+    _worker['field'] = np.ndarray(field_shape, dtype=np.uint8, buffer=_worker['shm'].buf,
+                                  offset=int(np.prod(board_shape)))
+    engine = AchtungEngine(training_mode=True)
+    engine.initialize(['r' for _ in range(num_players)])
+    _worker['engine'] = engine
+    _worker['state'] = State(ARENA_SHAPE, list(engine.positions), list(engine.angles), engine.colors)
+    _worker['players'] = {}
+
+
+def _search_subtree(args):
+    """ Searches one subtree of the root: a root action, followed by a move of the opponents (if any) """
+    from src.players.alpha_beta_player import AlphaBetaPlayer
+    (player_id, depth, seed, use_transposition_table), root, (action, opponent_actions) = args
+    positions, angles, alive, board_hash, opponents, all_actions, n_of_opp = root
+    state = _worker['state']
+    state.set_board(_worker['board'], _worker['field'], board_hash)
+    state.get_all_positions()[:] = positions
+    state.get_all_angles()[:] = angles
+    state.alive[:] = alive
+
+    if player_id not in _worker['players']:
+        _worker['players'][player_id] = AlphaBetaPlayer(player_id, _worker['engine'], depth, use_transposition_table)
+    player = _worker['players'][player_id]
+    player.seed = seed
+    player.first_round = False
+    player.initial_opponents = [i for i in range(n_of_opp) if i != player_id]
+    player.opponents = opponents
+    player.all_actions = all_actions
+    player.n_of_opp = n_of_opp
+    counters = (player.states_evaluated, player.successors_generated, player.tt_lookups, player.tt_hits)
+
+    player.update_successor_state([player_id], state, [action])
+    if opponent_actions is None:
+        value = player.alpha_beta(state, depth, -np.inf, np.inf, False, action)
+    else:
+        player.update_successor_state(player.opponents, state, opponent_actions)
+        value = player.alpha_beta(state, depth - 1, -np.inf, np.inf, True, action)
+    counters = (player.states_evaluated - counters[0], player.successors_generated - counters[1],
+                player.tt_lookups - counters[2], player.tt_hits - counters[3])
+    return value, counters
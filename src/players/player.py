@@ -33,6 +33,17 @@ class Player(object):
     def get_action(self, state):
         raise NotImplementedError('Please implement this method ')
 
+    def get_policy(self):
+        """
+        Returns the policy of the player. Players of the same policy (not None) choose their actions together, with a
+        single call of get_actions. None means the player chooses alone, with get_action.
+        """
+        return None
+
+    def get_actions(self, players, state):
+        """ Returns the actions of players, which all have the policy of this player, in order """
+        return [player.get_action(state) for player in players]
+
     # def act(self, action):
     #     if action == RIGHT:
     #         self.angle += self.d_theta
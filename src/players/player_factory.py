@@ -1,27 +1,38 @@
-from src.players.regular_player import RegularHumanPlayer
-from src.players.drl_player import DRLPlayer
 from src.players.random_player import RandomPlayer
 from src.players.alpha_beta_player import AlphaBetaPlayer
 from static.settings import *
-import pygame
 
-ARROWS_RIGHT = pygame.K_RIGHT
-ARROWS_LEFT = pygame.K_LEFT
-WASD_RIGHT = pygame.K_d
-WASD_LEFT = pygame.K_a
 MIN_MAX_DEPTH = 3
+# The time budget of every alpha-beta move in milliseconds, or None. With a budget the search deepens iteratively up to
+# MAX_SEARCH_DEPTH instead of searching to MIN_MAX_DEPTH however long that takes (15 to 90ms on open boards), so a move
+# fits in a frame of ITERATION_LENGTH with the rest of the tick.
+AB_TIME_BUDGET = ITERATION_LENGTH * 2 // 3
+MAX_SEARCH_DEPTH = 12
+# The number of worker processes of a fixed depth alpha-beta search (0 searches in the game process)
+AB_NUM_WORKERS = 0
+# Record the statistics of every alpha-beta move (see search_stats.py), in player.search_stats
+AB_SEARCH_STATS = False
 
 
 class PlayerFactory:
+    # Human players need pygame and DRL players need tensorflow, so they are only imported when they are created.
+    # This keeps the headless engine (and the alpha-beta and random players) free of both.
     @staticmethod
     def create_player(player_type, id, game):
         if player_type == 'ha':
+            from src.players.regular_player import RegularHumanPlayer, ARROWS_RIGHT, ARROWS_LEFT
             return RegularHumanPlayer(id, game, ARROWS_RIGHT, ARROWS_LEFT)
         elif player_type == 'hw':
+            from src.players.regular_player import RegularHumanPlayer, WASD_RIGHT, WASD_LEFT
             return RegularHumanPlayer(id, game, WASD_RIGHT, WASD_LEFT)
         elif player_type == 'd':
+            from src.players.drl_player import DRLPlayer
             return DRLPlayer(id, game, FC_ARCHITECTURE_PATH, FC_WEIGHT_PATH)
         elif player_type == 'r':
             return RandomPlayer(id, game)
         elif player_type == 'ab':
-            return AlphaBetaPlayer(id, game, MIN_MAX_DEPTH)
+            if AB_TIME_BUDGET is None:
+                return AlphaBetaPlayer(id, game, MIN_MAX_DEPTH, num_workers=AB_NUM_WORKERS,
+                                       search_stats=AB_SEARCH_STATS)
+            return AlphaBetaPlayer(id, game, MAX_SEARCH_DEPTH, time_budget=AB_TIME_BUDGET,
+                                   search_stats=AB_SEARCH_STATS)
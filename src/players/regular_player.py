@@ -2,9 +2,16 @@
 # parent_dir = os.path.dirname(current_dir)
 # sys.path.insert(0, parent_dir)
 
+import pygame
+
 from static.settings import *
 from src.players.player import Player
 
+ARROWS_RIGHT = pygame.K_RIGHT
+ARROWS_LEFT = pygame.K_LEFT
+WASD_RIGHT = pygame.K_d
+WASD_LEFT = pygame.K_a
+
 
 class RegularHumanPlayer(Player):
 
@@ -0,0 +1,121 @@
+import json
+import time
+
+import numpy as np
+
+# Statistics of the alpha-beta search, for tuning it. For every move: the nodes searched at every ply, the effective
+# branching factor, the alpha-beta cutoffs, the transposition table lookups and hits, and the time spent in the costly
+# parts of a node (update_successor_state, closest_obstacle_value and the territory heuristic). The moves of a game are
+# kept, aggregated by summary() and written by export(). The timed parts are wrapped per instance when the player is
+# created with search stats (see SearchStats.instrument), so a player without them runs the code untouched. Subtrees
+# searched by the workers of a parallel search are not counted.
+
+TIMED_PARTS = ['update_successor_state', 'closest_obstacle_value', 'score_function']
+
+
+class SearchStats(object):
+
+    def __init__(self, config=None):
+        """
+        :param config: the search parameters the stats were collected with (depth, territory weight, ...), exported with
+                       them.
+        """
+        self.config = config or {}
+        self.moves = []
+        self._move = None
+        self._counters = None
+        self._root_depth = 0
+
+    def instrument(self, player):
+        """ wraps the timed parts and the node search of an AlphaBetaPlayer """
+        player.update_successor_state = self.timed('update_successor_state', player.update_successor_state)
+        player.closest_obstacle_value = self.timed('closest_obstacle_value', player.closest_obstacle_value)
+        player.heuristic.score_function = self.timed('score_function', player.heuristic.score_function)
+        search_root, search_node = player.search_root, player.search_node
+
+        def counted_search_root(state, depth, *args):
+            self._root_depth = depth
+            self._move['nodes'].setdefault(depth, [])  # every iteration of a timed search is counted apart
+            return search_root(state, depth, *args)
+
+        def counted_search_node(state, depth, *args):
+            nodes = self._move['nodes'][self._root_depth]
+            ply = self._root_depth - depth  # the children of the root are ply 0
+            while len(nodes) <= ply:
+                nodes.append(0)
+            nodes[ply] += 1
+            return search_node(state, depth, *args)
+        player.search_root = counted_search_root
+        player.search_node = counted_search_node
+
+    def timed(self, part, function):
+        def timed_function(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self._move['times'][part] += time.perf_counter() - start
+        return timed_function
+
+    def begin_move(self, player):
+        self._move = {'nodes': {}, 'times': {part: 0.0 for part in TIMED_PARTS}, 'start': time.perf_counter()}
+        self._counters = self.get_counters(player)
+
+    def end_move(self, player, depth):
+        """
+        Records the move that began with begin_move.
+        :param depth: the depth the search completed (the deepest completed iteration of a timed search).
+        """
+        move, self._move = self._move, None
+        counters = {name: value - self._counters[name] for name, value in self.get_counters(player).items()}
+        iterations = move['nodes'].values()
+        nodes = [sum(counts[ply] for counts in iterations if ply < len(counts))
+                 for ply in range(max(map(len, iterations), default=0))]
+        self.moves.append({'depth': depth, 'time': time.perf_counter() - move['start'], 'nodes_per_ply': nodes,
+                           'nodes': sum(nodes), 'branching_factor': get_branching_factor(move['nodes'].get(depth, [])),
+                           'times': move['times'], **counters})
+
+    @staticmethod
+    def get_counters(player):
+        return {'cutoffs': player.cutoffs, 'successors_generated': player.successors_generated,
+                'states_evaluated': player.states_evaluated, 'tt_lookups': player.tt_lookups, 'tt_hits': player.tt_hits}
+
+    def summary(self):
+        """ Returns the statistics of all the recorded moves: totals, means per move and the parts of the time """
+        if not self.moves:
+            return {'moves': 0}
+        num_plies = max(len(move['nodes_per_ply']) for move in self.moves)
+        nodes_per_ply = [sum(move['nodes_per_ply'][ply] for move in self.moves if ply < len(move['nodes_per_ply']))
+                         for ply in range(num_plies)]
+        branching_factors = [move['branching_factor'] for move in self.moves if move['branching_factor'] is not None]
+        total_time = sum(move['time'] for move in self.moves)
+        times = {part: sum(move['times'][part] for move in self.moves) for part in TIMED_PARTS}
+        totals = {name: sum(move[name] for move in self.moves) for name in
+                  ['nodes', 'cutoffs', 'successors_generated', 'states_evaluated', 'tt_lookups', 'tt_hits']}
+        return {'moves': len(self.moves), 'total_time': total_time, 'mean_move_time': total_time / len(self.moves),
+                'mean_depth': float(np.mean([move['depth'] for move in self.moves])),
+                'nodes_per_ply': nodes_per_ply,
+                'branching_factor': float(np.mean(branching_factors)) if branching_factors else None,
+                'nodes_per_second': totals['nodes'] / max(total_time, 1e-9),
+                'cutoff_rate': totals['cutoffs'] / max(totals['nodes'], 1),
+                'tt_hit_rate': totals['tt_hits'] / max(totals['tt_lookups'], 1),
+                'times': times, 'time_fractions': {part: times[part] / max(total_time, 1e-9) for part in TIMED_PARTS},
+                **totals}
+
+    def export(self, path):
+        """ writes the config, the summary and every move to a JSON file """
+        with open(path, 'w') as stats_file:
+            json.dump({'config': self.config, 'summary': self.summary(), 'moves': self.moves}, stats_file, indent=1)
+
+    def reset(self):
+        self.moves = []
+
+
+def get_branching_factor(nodes_per_ply):
+    """
+    Returns the effective branching factor of a search: the geometric mean of the growth of the number of nodes per
+    ply. The branching factor of a move is the one of its deepest completed search.
+    """
+    if len(nodes_per_ply) < 2 or not nodes_per_ply[0]:
+        return None
+    return float((nodes_per_ply[-1] / nodes_per_ply[0]) ** (1 / (len(nodes_per_ply) - 1)))
@@ -0,0 +1,60 @@
+import sys
+from collections import OrderedDict
+
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high, the value is at least the stored one
+UPPER_BOUND = 2  # the search failed low, the value is at most the stored one
+
+TT_CAPACITY = 2 ** 16
+POSITION_QUANTUM = 1  # pixels
+ANGLE_QUANTUM = 0.01  # radians
+
+
+class TranspositionTable(object):
+    """
+    A bounded table of searched positions. Every entry is a tuple (value, depth, flag, move), where flag tells whether
+    value is exact or a bound, and move is the best move found at the position (None if unknown). When the table is
+    full the least recently used entry is evicted.
+    """
+
+    def __init__(self, capacity=TT_CAPACITY):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value, depth, flag, move=None):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > depth:
+            # keep the deeper search of the same position
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = (value, depth, flag, move)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def memory_usage(self):
+        """ Returns an estimate of the memory used by the table, in bytes """
+        if not self._entries:
+            return sys.getsizeof(self._entries)
+        key, entry = next(iter(self._entries.items()))
+        per_entry = sys.getsizeof(key) + sum(sys.getsizeof(item) for item in key) + sys.getsizeof(entry)
+        return sys.getsizeof(self._entries) + len(self._entries) * per_entry
+
+
+def get_position_key(state, max_player):
+    """ Returns the key of a search node: the quantized positions, angles and lives of the players and the board hash """
+    positions = tuple((round(x / POSITION_QUANTUM), round(y / POSITION_QUANTUM)) for x, y in state.get_all_positions())
+    angles = tuple(round(angle / ANGLE_QUANTUM) for angle in state.get_all_angles())
+    return positions, angles, tuple(state.alive), state.get_board_hash(), max_player
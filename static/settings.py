@@ -1,7 +1,5 @@
 import os
 
-import pygame
-
 GAME_NAME = "Achtung"
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -31,6 +29,11 @@ INTRO_LEN = 30
 ITERATION_LENGTH = 15
 TRYOUT_TIME = 30
 
+# tick profiling of the game loop (see src/environment/profiler.py)
+PROFILE_TICKS = False
+PROFILE_OVERLAY = True  # show the mean time of every phase on the dashboard
+PROFILE_PATH = os.path.join(BASE_DIR, 'tick_profile.json')  # written at the end of a game, None to skip
+
 # Colors
 WHITE = (255, 255, 255)
 PURPLE = (255, 0, 255)
@@ -67,9 +70,12 @@ D_THETA = 0.09
 NO_DRAW_TIME = 20
 ACTION_SAMPLING_RATE = 5
 HEAD_COLOR = GREEN
+# move on a lattice of headings with precomputed displacements, see src/environment/heading_lattice.py
+HEADING_LATTICE = False
 
-pygame.font.init()
-FONT = pygame.font.Font(os.path.join(STATIC_ROOT, 'fonts', 'stereofidelic.ttf'), 20)
+# The font is loaded by the pygame front-end (AchtungEnv.entry), so importing the settings does not start SDL
+FONT_PATH = os.path.join(STATIC_ROOT, 'fonts', 'stereofidelic.ttf')
+FONT_SIZE = 20
 
 CIRCLE_RADIUS_4 = ([-4, -1], [-4, 0],
                    [-3, -3], [-3, -2], [-3, -1], [-3, 0], [-3, 1], [-3, 2],
@@ -0,0 +1,137 @@
+import os
+import sys
+import copy
+import random
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from static.settings import *
+from src.environment.training_environment import TrainingEnv
+
+# AchtungEngine.advance(k) defers the distance field updates of the k ticks to one batch at the end, and must give the
+# same game, bit for bit, as calling tick() k times. Both are run from the same seeded positions with the same seeded
+# actions, through TrainingEnv.step, and every observable of the state is compared after every step. Both draw through
+# State.draw_players, so the board and the distance field are also compared with a reference that replays the drawing
+# of the original update_states: draw_head and draw_player for every player, one circle at a time, each rounded,
+# clipped, written to the board and marked in the distance field on its own.
+
+SEEDS = [0, 1, 2, 3, 4]
+PLAYER_COUNTS = [1, 2, 4]
+NUM_STEPS = 60
+
+
+def step_with_ticks(env, action, player_id=0):
+    """ TrainingEnv.step, with the ticks run one by one by tick() instead of advance() """
+    if not env.state.alive[player_id]:
+        return None, 0
+    env.actions[player_id] = action
+    others = [i for i in range(len(env.players)) if i != player_id and env.state.alive[i]]
+    for i, other_action in zip(others, env.get_actions(others)):
+        env.actions[i] = other_action
+    for _ in range(env.action_sampling_rate):
+        env.tick()
+    return env.get_state(player_id), 1
+
+
+def draw_circle_reference(state, color_2d, center, radius):
+    """ State.draw_circle as it was before the stamps: the pixels of the circle, rounded and clipped one by one """
+    circle = state.clip(np.round(np.array(CIRCLES[radius - 1]) + np.array(center)).astype(int))
+    rows, cols = circle[..., 1] + state.margin, circle[..., 0] + state.margin
+    state.get_full_board()[rows, cols] = color_2d
+    if color_2d != BLACK_2D:
+        state.get_distance_field().mark(rows, cols)
+
+
+def update_states_reference(env):
+    """ AchtungEngine.update_states as it was before draw_players: draw_head then draw_player, player by player """
+    state = env.state
+    for i in range(len(env.players)):
+        state.set_angle(i, env.angles[i])
+        draw_circle_reference(state, HEAD_2D, env.get_head_position(env.positions[i], env.angles[i]), HEAD_RADIUS)
+        state.counts[i] += 1
+        draw_circle_reference(state, i + 2 if env.draw_status[i] else BLACK_2D, state.get_position(i), PLAYER_RADIUS)
+
+
+def play(env, step, seed):
+    """ Plays NUM_STEPS steps of seeded actions and returns a snapshot of the game after every step """
+    np.random.seed(seed)
+    random.seed(seed)
+    actions = np.random.RandomState(seed).randint(0, 3, NUM_STEPS)
+    snapshots = []
+    for action in actions:
+        features, _ = step(env, int(action))
+        state = env.state
+        snapshots.append({'board': state.get_board().copy(), 'distance_field': state.get_distance_field().values.copy(),
+                          'board_hash': state.get_board_hash(), 'calc_board_hash': state.calc_board_hash(),
+                          'positions': list(state.get_all_positions()), 'angles': list(state.get_all_angles()),
+                          'alive': list(state.alive), 'counts': list(state.counts), 'features': features,
+                          'gaps': not all(env.draw_status)})
+        if features is None:
+            break
+    return snapshots
+
+
+class TestAdvance(unittest.TestCase):
+
+    def assert_same_features(self, expected, actual):
+        if expected is None or actual is None:
+            self.assertIs(expected, actual)
+            return
+        self.assertEqual(type(expected), type(actual))
+        if isinstance(expected, (tuple, list)):
+            self.assertEqual(len(expected), len(actual))
+            for expected_part, actual_part in zip(expected, actual):
+                self.assert_same_features(expected_part, actual_part)
+        else:
+            np.testing.assert_array_equal(expected, actual)
+
+    def test_advance_equals_ticks(self):
+        for num_players in PLAYER_COUNTS:
+            for seed in SEEDS:
+                with self.subTest(num_players=num_players, seed=seed):
+                    np.random.seed(seed)
+                    random.seed(seed)
+                    env = TrainingEnv(['r' for _ in range(num_players)], training_mode=True)
+                    env.state.enable_hashing()
+                    expected = play(copy.deepcopy(env), step_with_ticks, seed)
+                    actual = play(copy.deepcopy(env), TrainingEnv.step, seed)
+                    self.assertEqual(len(expected), len(actual))
+                    for step, (before, after) in enumerate(zip(expected, actual)):
+                        np.testing.assert_array_equal(before['board'], after['board'], f'board at step {step}')
+                        np.testing.assert_array_equal(before['distance_field'], after['distance_field'],
+                                                      f'distance field at step {step}')
+                        for key in ['board_hash', 'calc_board_hash', 'positions', 'angles', 'alive']:
+                            self.assertEqual(before[key], after[key], f'{key} at step {step}')
+                        self.assert_same_features(before['features'], after['features'])
+                    self.assertEqual(actual[-1]['board_hash'], actual[-1]['calc_board_hash'])
+
+    def test_draw_players_equals_reference(self):
+        gaps = False
+        for num_players in PLAYER_COUNTS:
+            for seed in SEEDS:
+                with self.subTest(num_players=num_players, seed=seed):
+                    np.random.seed(seed)
+                    random.seed(seed)
+                    env = TrainingEnv(['r' for _ in range(num_players)], training_mode=True)
+                    reference_env = copy.deepcopy(env)
+                    reference_env.update_states = lambda: update_states_reference(reference_env)
+                    expected = play(reference_env, step_with_ticks, seed)
+                    for step in [step_with_ticks, TrainingEnv.step]:  # draw_players, with and without deferred marks
+                        actual = play(copy.deepcopy(env), step, seed)
+                        self.assertEqual(len(expected), len(actual))
+                        for i, (before, after) in enumerate(zip(expected, actual)):
+                            np.testing.assert_array_equal(before['board'], after['board'], f'board at step {i}')
+                            np.testing.assert_array_equal(before['distance_field'], after['distance_field'],
+                                                          f'distance field at step {i}')
+                            for key in ['positions', 'angles', 'alive', 'counts']:
+                                self.assertEqual(before[key], after[key], f'{key} at step {i}')
+                    gaps = gaps or any(snapshot['gaps'] for snapshot in expected)
+        self.assertTrue(gaps, 'no drawing gap was replayed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import random
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from static.settings import *
+from src.environment.state import State
+from src.environment.training_environment import TrainingEnv
+from src.environment.batched_environment import BatchedAchtungEnv
+
+# BatchedAchtungEnv must play every one of its games like a TrainingEnv. N TrainingEnvs are started from the positions,
+# angles and drawing limits of the N batched games, the random opponents are given the actions the batched env draws,
+# and the observations, rewards and done flags of every step are compared. The batched env draws its random numbers for
+# all games at once, so the only numbers copied over after every step are the drawing limits it drew for the players
+# whose gap ended (a new limit is at least 50 ticks away, so it never takes effect within the step it was drawn in).
+
+SEEDS = [0, 1, 2]
+NUM_ENVS = 4
+PLAYER_COUNTS = [1, 3]
+NUM_STEPS = 80
+
+
+def start_like(env, batched, game):
+    """ Restarts a TrainingEnv from the start of a batched game, like AchtungEngine.reset """
+    env.angles = batched.angles[game].tolist()
+    env.positions = [tuple(position) for position in batched.positions[game].tolist()]
+    env.state = State(ARENA_SHAPE, env.positions, env.angles, env.colors)
+    env.draw_limits = batched.draw_limits[game].tolist()
+    env.update_states()
+
+
+def peek_opponent_actions(batched):
+    """ Returns the opponent actions the next step of the batched env draws, without consuming them """
+    rng_state = np.random.get_state()
+    actions = np.random.randint(len(ACTIONS), size=batched.actions.shape)
+    np.random.set_state(rng_state)
+    return actions
+
+
+def step_with_actions(env, action, opponent_actions):
+    """ TrainingEnv.step, with the actions of the random opponents given """
+    if not env.state.alive[0]:
+        return None, 0
+    env.actions[0] = action
+    for i in range(1, len(env.players)):
+        if env.state.alive[i]:
+            env.actions[i] = int(opponent_actions[i])
+    env.advance(env.action_sampling_rate)
+    return env.get_state(0), 1
+
+
+class TestBatchedEnvironment(unittest.TestCase):
+
+    def test_unsupported_opponents(self):
+        with self.assertRaises(ValueError):
+            BatchedAchtungEnv(2, ['r', 'ab'])
+
+    def test_games_equal_training_envs(self):
+        for num_players in PLAYER_COUNTS:
+            for seed in SEEDS:
+                with self.subTest(num_players=num_players, seed=seed):
+                    np.random.seed(seed)
+                    random.seed(seed)
+                    batched = BatchedAchtungEnv(NUM_ENVS, ['r' for _ in range(num_players)])
+                    envs = [TrainingEnv(['r' for _ in range(num_players)], training_mode=True)
+                            for _ in range(NUM_ENVS)]
+                    for game, env in enumerate(envs):
+                        start_like(env, batched, game)
+                    np.testing.assert_array_equal(batched.get_states(),
+                                                  [env.get_state(0) for env in envs])
+                    actions = np.random.RandomState(seed).randint(0, len(ACTIONS), (NUM_STEPS, NUM_ENVS))
+                    for step in range(NUM_STEPS):
+                        opponent_actions = peek_opponent_actions(batched)
+                        states, rewards, dones = batched.step(actions[step])
+                        for game, env in enumerate(envs):
+                            state, reward = step_with_actions(env, actions[step, game], opponent_actions[game])
+                            self.assertEqual(dones[game], state is None, f'done of game {game} at step {step}')
+                            self.assertEqual(rewards[game], reward, f'reward of game {game} at step {step}')
+                            if state is not None:
+                                np.testing.assert_array_equal(states[game], state,
+                                                              f'observation of game {game} at step {step}')
+                                self.assertEqual(batched.alive[game].tolist(), env.state.alive)
+                            env.draw_limits = batched.draw_limits[game].tolist()
+                        if dones.all():
+                            break
+
+
+if __name__ == '__main__':
+    unittest.main()